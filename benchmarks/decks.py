@@ -0,0 +1,115 @@
+'''Benchmarks how solve time scales with the number of decks and jokers.
+
+For each deck (2 to 4 copies of each card and 0, 2 or 4 jokers), positions
+are dealt with the table holding a growing share of the deck, up to
+late-game tables with every card out (see `suite.deal_position`).  Half of
+the jokers replace table cards (which keeps the table validly grouped) and
+the rest are in the hand.  Each position is solved with a fresh Solver per
+backend.  The native backend is skipped for positions with jokers (they are
+always solved with SciPy's MILP solver).  Its search can take minutes on
+large three- and four-deck tables unless the LP relaxation is solved first
+(--lp-first).
+
+Usage:
+  python benchmarks/decks.py [--decks 2 3 4] [--jokers 0 2 4] [--out decks.json]
+  python benchmarks/decks.py --backend native --lp-first --jokers 0
+
+Exits with status 1 if any solve takes longer than --max-seconds.
+'''
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from machiavelli.cards import CARDS, JOKER, Cards, Deck
+from suite import deal_position
+
+
+TABLE_SHARES = (0.25, 0.5, 0.75, 0.85)
+HAND_SIZE = 12
+
+
+def deck_positions(copies, jokers, seed=0):
+    '''Returns a list of (name, table, hand) positions for the deck.'''
+    rng = random.Random(seed)
+    n_cards = len(CARDS) * copies
+    positions = []
+    def add_jokers(table, hand):
+        on_table = jokers // 2
+        for card in rng.sample(list(table), on_table):
+            table = table - Cards([card]) + Cards([JOKER])
+        return table, hand + Cards([JOKER] * (jokers - on_table))
+    for share in TABLE_SHARES:
+        table_size = int(n_cards * share)
+        table, hand = deal_position(rng, table_size, HAND_SIZE, 'double',
+                                    copies)
+        positions.append((f't{table_size}', *add_jokers(table, hand)))
+    # Every card of the decks is out
+    hand = Cards(rng.sample(CARDS * copies, HAND_SIZE))
+    positions.append(('full', *add_jokers(Cards(CARDS * copies) - hand, hand)))
+    return positions
+
+def run_decks(decks, jokers, backends, seed=0, lp_first=False):
+    from machiavelli.solver import Solver
+    # Warm up imports so they aren't counted in the first position
+    Solver(quiet=True).solve('1s,2s,3s')
+    results = []
+    for copies in decks:
+        for n_jokers in jokers:
+            deck = Deck(copies, n_jokers)
+            for name, table, hand in deck_positions(copies, n_jokers, seed):
+                for backend in backends:
+                    if backend == 'native' and n_jokers:
+                        continue
+                    solver = Solver(quiet=True, backend=backend, deck=deck,
+                                    lp_first=lp_first)
+                    start = time.perf_counter()
+                    sol = solver.solve(table + hand, hand)
+                    seconds = time.perf_counter() - start
+                    result = dict(
+                        decks=copies, jokers=n_jokers, position=name,
+                        backend=backend, table_cards=len(table),
+                        hand_cards=len(hand), seconds=seconds,
+                        program_groups=solver.stats.get('program_groups', 0),
+                        cards_used=None if sol is None else sol.n_used,
+                        groups=None if sol is None else len(sol),
+                    )
+                    results.append(result)
+                    print(f'decks {copies} jokers {n_jokers} {name:5s} '
+                          f'{backend:7s} {seconds*1000:9.1f} ms  '
+                          f'{result["program_groups"]:4d} groups  '
+                          f'{result["cards_used"]} cards used',
+                          file=sys.stderr)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--decks', type=int, nargs='+', default=[2, 3, 4])
+    parser.add_argument('--jokers', type=int, nargs='+', default=[0, 2, 4])
+    parser.add_argument('--backend', nargs='+', default=['milp'])
+    parser.add_argument('--lp-first', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='Writes the results as JSON')
+    parser.add_argument('--max-seconds', type=float, default=1.0)
+    args = parser.parse_args()
+
+    results = run_decks(args.decks, args.jokers, args.backend, args.seed,
+                        args.lp_first)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=1)
+    slow = [r for r in results if r['seconds'] > args.max_seconds]
+    for r in slow:
+        print(f"SLOW decks {r['decks']} jokers {r['jokers']} {r['position']} "
+              f"{r['backend']}: {r['seconds']*1000:.1f} ms")
+    if slow:
+        sys.exit(1)
+    print(f'Every solve took at most {args.max_seconds} s')
+
+if __name__ == '__main__':
+    main()
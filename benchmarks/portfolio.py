@@ -0,0 +1,67 @@
+'''Races the MIP solvers of the portfolio backend on the benchmark corpus and
+reports which solver wins for each program shape.
+
+Each position of the corpus (see `suite.py`) is solved with a fresh
+portfolio Solver.  Programs are keyed by their shape (see
+`machiavelli.solver.program_shape`) so the default solver can be chosen
+from which solver wins most on the shapes seen in play.
+
+Usage:
+  python benchmarks/portfolio.py [--solvers native HIGHS SCIPY] [--out wins.json]
+'''
+
+import argparse
+import collections
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from suite import corpus
+
+
+def run_portfolio(solvers=None, seed=0, match=None):
+    '''Returns {shape: {solver: wins}} over the corpus.'''
+    from machiavelli.solver import Solver
+    wins = collections.defaultdict(collections.Counter)
+    for name, table, hand in corpus(seed):
+        if match and match not in name:
+            continue
+        solver = Solver(quiet=True, backend='portfolio', portfolio=solvers)
+        start = time.perf_counter()
+        solver.find_solution(table + hand, hand)
+        seconds = time.perf_counter() - start
+        for shape, counts in solver.portfolio_wins.items():
+            wins[shape].update(counts)
+        print(f'{name:24s} {seconds*1000:9.1f} ms  '
+              + '  '.join(f'{shape} {",".join(counts)}'
+                          for shape, counts in solver.portfolio_wins.items()),
+              file=sys.stderr)
+    return {shape: dict(counts) for shape, counts in sorted(wins.items())}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--solvers', nargs='+', help=
+        'The solvers to race (default: every installed one)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--match', help='Only run positions containing this')
+    parser.add_argument('--out', help='Writes the wins as JSON')
+    args = parser.parse_args()
+
+    wins = run_portfolio(args.solvers, seed=args.seed, match=args.match)
+    totals = collections.Counter()
+    for shape, counts in wins.items():
+        totals.update(counts)
+        print(f'{shape:16s} ' + '  '.join(
+            f'{solver} {n}' for solver, n in
+            sorted(counts.items(), key=lambda item: -item[1])))
+    print('total            ' + '  '.join(
+        f'{solver} {n}' for solver, n in totals.most_common()))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(wins, f, indent=1)
+
+if __name__ == '__main__':
+    main()
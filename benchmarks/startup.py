@@ -0,0 +1,82 @@
+'''Measures the startup time of the machiavelli command line.
+
+Runs the `run_from_command_line` entry point in fresh interpreters and
+reports the median wall time of:
+  help    `machiavelli --help`
+  prompt  until `Enter starting hand:` is printed
+  solve   until the first solve of a small hand is printed
+
+Usage: python benchmarks/startup.py [--repeat N] [--backend cvxpy|native]
+'''
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY = 'from machiavelli.command import run_from_command_line as r; r()'
+
+
+def start(args):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    return subprocess.Popen(
+        [sys.executable, '-c', ENTRY, *args],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL, env=env, cwd=ROOT)
+
+def wait_for(proc, marker):
+    '''Reads stdout until marker appears.'''
+    out = b''
+    while marker not in out:
+        data = os.read(proc.stdout.fileno(), 4096)
+        if not data:
+            raise RuntimeError(f'process exited before {marker!r}')
+        out += data
+
+def time_help():
+    t = time.perf_counter()
+    proc = start(['--help'])
+    proc.communicate()
+    return time.perf_counter() - t
+
+def time_prompt(backend):
+    t = time.perf_counter()
+    proc = start(['--nocolor', '--backend', backend])
+    wait_for(proc, b'Enter starting hand:')
+    elapsed = time.perf_counter() - t
+    proc.kill()
+    proc.wait()
+    return elapsed
+
+def time_solve(backend):
+    t = time.perf_counter()
+    proc = start(['--nocolor', '--backend', backend, '', '1s,2s,3s,kh'])
+    wait_for(proc, b'Enter drawn card(s)')
+    elapsed = time.perf_counter() - t
+    proc.kill()
+    proc.wait()
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--backend', default='milp')
+    args = parser.parse_args()
+
+    cases = [
+        ('help', time_help),
+        ('prompt', lambda: time_prompt(args.backend)),
+        ('solve', lambda: time_solve(args.backend)),
+    ]
+    for name, fn in cases:
+        times = [fn() for _ in range(args.repeat)]
+        print(f'{name:8s} median {statistics.median(times)*1000:8.1f} ms  '
+              f'min {min(times)*1000:8.1f} ms')
+
+if __name__ == '__main__':
+    main()
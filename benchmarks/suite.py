@@ -0,0 +1,205 @@
+'''Benchmarks Solver.solve on a fixed corpus of positions.
+
+The corpus is generated from a seed and scales the table size (from empty to
+all 104 cards of both decks), the hand size and how many cards are
+duplicated.  It also has the late-game position from the README.  Each
+position is solved with a fresh Solver per backend and the time of each phase
+(see `Solver.timings`) is recorded.
+
+Usage:
+  python benchmarks/suite.py [--backend cvxpy native] [--out results.json]
+  python benchmarks/suite.py --save-baseline benchmarks/baseline.json
+  python benchmarks/suite.py --baseline benchmarks/baseline.json
+
+With --baseline, exits with status 1 if any position got slower than the
+baseline by more than --tolerance (relative) and --min-diff (seconds).
+'''
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from machiavelli.cards import CARDS, NUMBERS, SUITS, Cards
+
+
+TABLE_SIZES = (0, 10, 20, 40, 60, 80, 95)
+HAND_SIZES = (1, 5, 12)
+DENSITIES = ('single', 'double')
+
+# The late-game position from the README demo (68 cards on the table)
+README_ENDGAME = (
+    '1c,1d,1d,1h,2s,2c,2d,2d,2h,3s,3c,3d,3h,4s,4s,4c,4d,4h,5s,5c,5d,5h,6s,6c,'
+    '6d,6d,6h,7s,7s,7c,7c,7d,7d,7h,8s,8s,8c,8d,8d,8h,8h,9s,9s,9c,9d,9h,ts,ts,'
+    'tc,tc,td,th,th,js,js,jc,jc,jd,jd,jh,jh,qs,qd,qh,ks,ks,kc,kh',
+    'kh',
+)
+
+
+def random_group(rng):
+    '''Returns the cards of a random set or sequence.'''
+    if rng.random() < 0.4:
+        rank = rng.choice(NUMBERS)
+        return [rank+s for s in rng.sample(SUITS, rng.choice((3, 3, 4)))]
+    suit = rng.choice(SUITS)
+    length = rng.randint(3, 7)
+    start = rng.randint(0, len(NUMBERS) + 1 - length)
+    ranks = NUMBERS + NUMBERS[0]
+    return [n+suit for n in ranks[start:start+length]]
+
+def deal_position(rng, table_size, hand_size, density, copies=2):
+    '''Returns (table, hand) with a validly grouped table of about
+    table_size cards from `copies` decks.
+
+    With density 'double', groups are placed twice when possible so most
+    table cards are duplicated.'''
+    deck = Cards(CARDS * copies)
+    table = Cards()
+    tries = 0
+    while len(table) < table_size and tries < 10000:
+        tries += 1
+        group = Cards(random_group(rng))
+        times = 2 if density == 'double' else 1
+        if len(table) + len(group) * times > table_size + 2:
+            times = 1
+        for _ in range(times):
+            if group <= deck and len(table) + len(group) <= table_size + 2:
+                deck -= group
+                table += group
+    hand = Cards(rng.sample(list(deck), hand_size))
+    return table, hand
+
+def corpus(seed=0):
+    '''Returns a list of (name, table, hand) positions.'''
+    rng = random.Random(seed)
+    positions = []
+    for density in DENSITIES:
+        for table_size in TABLE_SIZES:
+            for hand_size in HAND_SIZES:
+                table, hand = deal_position(rng, table_size, hand_size,
+                                            density)
+                name = f'{density}-t{table_size}-h{hand_size}'
+                positions.append((name, table, hand))
+    # Every card of both decks is out
+    for hand_size in HAND_SIZES:
+        hand = Cards(rng.sample(CARDS * 2, hand_size))
+        positions.append((f'full-h{hand_size}', Cards(CARDS * 2) - hand,
+                          hand))
+    positions.append(('readme-endgame', *map(Cards, README_ENDGAME)))
+    return positions
+
+def run_position(backend, table, hand, repeat):
+    '''Solves a position repeat times (with a new Solver each time) and
+    returns the phase timings of the run with the median total time.'''
+    from machiavelli.solver import Solver
+    runs = []
+    for _ in range(repeat):
+        solver = Solver(backend=backend, color=False)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            sol = solver.solve(table + hand, hand)
+        total = time.perf_counter() - start
+        runs.append((total, dict(solver.timings), sol))
+    runs.sort(key=lambda run: run[0])
+    total, phases, sol = runs[len(runs) // 2]
+    return dict(
+        total=total,
+        phases=phases,
+        cards_used=None if sol is None else sum(len(g) for g in sol),
+        groups=None if sol is None else len(sol),
+    )
+
+def run_suite(backends, repeat=3, seed=0, match=None):
+    import numpy
+    # Warm up imports so they aren't counted in the first position
+    for backend in backends:
+        run_position(backend, Cards('1s,2s,3s'), Cards(), 1)
+    results = []
+    for name, table, hand in corpus(seed):
+        if match and match not in name:
+            continue
+        for backend in backends:
+            result = run_position(backend, table, hand, repeat)
+            result.update(position=name, backend=backend,
+                          table_cards=len(table), hand_cards=len(hand))
+            results.append(result)
+            print(f'{name:24s} {backend:7s} {result["total"]*1000:9.1f} ms  '
+                  + '  '.join(f'{k} {v*1000:.1f}'
+                              for k, v in result['phases'].items()),
+                  file=sys.stderr)
+    meta = dict(
+        seed=seed,
+        repeat=repeat,
+        python=platform.python_version(),
+        machine=platform.machine(),
+        numpy=numpy.__version__,
+        time=time.strftime('%Y-%m-%dT%H:%M:%S'),
+    )
+    import scipy
+    meta['scipy'] = scipy.__version__
+    try:
+        import cvxpy
+        meta['cvxpy'] = cvxpy.__version__
+    except ImportError:
+        pass
+    return dict(meta=meta, results=results)
+
+def compare(results, baseline, tolerance, min_diff):
+    '''Returns a list of messages for results slower than the baseline.'''
+    old = {(r['position'], r['backend']): r for r in baseline['results']}
+    regressions = []
+    for r in results['results']:
+        b = old.get((r['position'], r['backend']))
+        if b is None:
+            continue
+        if (r['total'] > b['total'] * (1 + tolerance)
+                and r['total'] - b['total'] > min_diff):
+            regressions.append(
+                f"{r['position']} {r['backend']}: {b['total']*1000:.1f} ms "
+                f"-> {r['total']*1000:.1f} ms")
+        if (r['cards_used'], r['groups']) != (b['cards_used'], b['groups']):
+            regressions.append(
+                f"{r['position']} {r['backend']}: solution changed from "
+                f"{b['cards_used']} cards in {b['groups']} groups to "
+                f"{r['cards_used']} cards in {r['groups']} groups")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--backend', nargs='+', default=['milp', 'cvxpy', 'native'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--match', help='Only run positions containing this')
+    parser.add_argument('--out', help='Writes the results as JSON')
+    parser.add_argument('--save-baseline', metavar='FILE')
+    parser.add_argument('--baseline', metavar='FILE')
+    parser.add_argument('--tolerance', type=float, default=0.5)
+    parser.add_argument('--min-diff', type=float, default=0.05)
+    args = parser.parse_args()
+
+    results = run_suite(args.backend, repeat=args.repeat, seed=args.seed,
+                        match=args.match)
+    for path in (args.out, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance,
+                              args.min_diff)
+        for msg in regressions:
+            print(f'REGRESSION {msg}')
+        if regressions:
+            sys.exit(1)
+        print('No regressions')
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,12 @@
-from .solver import Solver, parse_cards, input_cards, ParseError, sorted_cards
+from .cards import (
+    Cards, parse_cards, input_cards, ParseError, sorted_cards
+)
+from .cache import SolutionCache
+
+
+def __getattr__(name):
+    # Import the solver (and numpy, scipy) only when it is used
+    if name in ('Solver', 'Position', 'Solution'):
+        from . import solver
+        return getattr(solver, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
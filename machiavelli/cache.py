@@ -0,0 +1,136 @@
+'''Caches solutions by position, treating positions that only differ by a
+relabeling of the suits as the same.
+
+Sets and sequences treat all suits alike so a solution for one position can
+be mapped to any position with the suits permuted.  Positions are stored in a
+canonical form where the suits are sorted by their cards.
+'''
+
+import collections
+import threading
+
+from .cards import CARDS, SUITS, Cards
+
+
+N_SUITS = len(SUITS)
+N_RANKS = len(CARDS) // N_SUITS
+
+CacheInfo = collections.namedtuple('CacheInfo',
+                                   'hits misses maxsize currsize')
+
+
+def canonical_position(cards, optional_cards=()):
+    '''Returns (key, suit_order) where key is a bytes form of the position
+    that is the same for every relabeling of the suits and canonical suit i
+    is suit `suit_order[i]` of the given cards.'''
+    counts = bytes(Cards(cards))
+    optional = bytes(Cards(optional_cards))
+    def suit_signature(s):
+        return counts[s::N_SUITS], optional[s::N_SUITS]
+    suit_order = sorted(range(N_SUITS), key=suit_signature, reverse=True)
+    key = b''.join(
+        bytes(data[r*N_SUITS + s] for r in range(N_RANKS) for s in suit_order)
+        for data in (counts, optional)
+    )
+    return key, tuple(suit_order)
+
+def relabel_suits(cards, suit_order):
+    '''Maps cards in canonical suits back to the original suits.'''
+    canon = bytes(cards)
+    counts = bytearray(len(CARDS))
+    for r in range(N_RANKS):
+        for i, s in enumerate(suit_order):
+            counts[r*N_SUITS + s] = canon[r*N_SUITS + i]
+    return Cards.from_bytes(counts)
+
+def canonicalize_suits(cards, suit_order):
+    '''Maps cards in the original suits to the canonical suits.'''
+    counts = bytes(cards)
+    return Cards.from_bytes(
+        counts[r*N_SUITS + s] for r in range(N_RANKS) for s in suit_order)
+
+
+class SolutionCache:
+    '''A least-recently-used cache of solutions keyed by canonical position.
+
+    If `path` is given, solutions are also stored in an sqlite database at
+    that path so they are kept between sessions.  Only found solutions are
+    cached (not failures).  The cache can be shared between threads.
+    '''
+    def __init__(self, maxsize=4096, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._memory = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path is not None:
+            import sqlite3
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS solutions '
+                             '(position BLOB PRIMARY KEY, groups BLOB)')
+            self._db.commit()
+
+    def get(self, cards, optional_cards=()):
+        '''Returns the cached solution (a list of Cards groups) or None.'''
+        key, suit_order = canonical_position(cards, optional_cards)
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+            elif self._db is not None:
+                row = self._db.execute(
+                    'SELECT groups FROM solutions WHERE position = ?',
+                    (key,)).fetchone()
+                if row is not None:
+                    data = bytes(row[0])
+                    self._remember(key, data)
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return [
+            relabel_suits(data[i:i+len(CARDS)], suit_order)
+            for i in range(0, len(data), len(CARDS))
+        ]
+
+    def put(self, cards, optional_cards, sol):
+        '''Stores a solution (a list of Cards groups) for the position.'''
+        if sol is None:
+            return
+        key, suit_order = canonical_position(cards, optional_cards)
+        data = b''.join(bytes(canonicalize_suits(group, suit_order))
+                        for group in sol)
+        with self._lock:
+            self._remember(key, data)
+            if self._db is not None:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO solutions VALUES (?, ?)',
+                    (key, data))
+                self._db.commit()
+
+    def _remember(self, key, data):
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def info(self):
+        '''Returns the hits, misses and size of the in-memory cache.'''
+        return CacheInfo(self.hits, self.misses, self.maxsize,
+                         len(self._memory))
+
+    def clear(self):
+        '''Clears the in-memory cache and counters (not the database).'''
+        with self._lock:
+            self._memory.clear()
+            self.hits = self.misses = 0
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def __len__(self):
+        return len(self._memory)
@@ -0,0 +1,262 @@
+'''Card names, parsing and the `Cards` multiset.
+
+This module only uses the standard library so the command line can parse
+arguments and prompt for cards before the solver's dependencies (numpy,
+scipy and optionally cvxpy) are imported.  It also names the solver
+backends (`BACKENDS`) and checks that they are installed for the same
+reason.
+'''
+
+import sys
+import collections
+import importlib.util
+import itertools
+
+
+NUMBERS = '123456789tjqk'  # Allowed alternate inputs: a->1, 0->t, 10->t, emoji
+SUITS = 'scdh'
+CARDS = [
+    n+s
+    for n, s in itertools.product(NUMBERS, SUITS)
+]
+CARD_IDX = {card: i for i, card in enumerate(CARDS)}
+# A wild card that can stand in for any card of a group.  Jokers are counted
+# by `Cards` after the cards in `CARDS`.
+JOKER = 'jk'
+_SLOTS = {**CARD_IDX, JOKER: len(CARDS)}
+MAX_COPIES = 4  # The most decks a game can be played with
+# The backends of `solver.Solver`
+BACKENDS = ('milp', 'cvxpy', 'native', 'portfolio')
+
+
+def backend_error(backend):
+    '''Returns why `backend` can't be used here (its optional dependency isn't
+    installed) or None.  Nothing is imported.'''
+    if backend == 'cvxpy' and importlib.util.find_spec('cvxpy') is None:
+        return ('the cvxpy backend needs CVXPY: '
+                'pip install machiavelli[cvxpy]')
+    return None
+
+
+class Deck(collections.namedtuple('Deck', 'copies jokers')):
+    '''The cards a game is played with: `copies` of each card in `CARDS`
+    (the number of decks) and a number of `jokers`.'''
+    __slots__ = ()
+
+    def __new__(cls, copies=2, jokers=0):
+        if not 1 <= copies <= MAX_COPIES:
+            raise ValueError(f'copies must be from 1 to {MAX_COPIES}')
+        if jokers < 0:
+            raise ValueError('jokers must not be negative')
+        return super().__new__(cls, copies, jokers)
+
+    def cards(self):
+        '''Returns every card of the deck.'''
+        return Cards(CARDS * self.copies + [JOKER] * self.jokers)
+
+    def check(self, cards):
+        '''Raises ValueError if `cards` has more copies of a card or more
+        jokers than the deck.'''
+        if cards.max_count() > self.copies:
+            card = max(set(cards) - {JOKER}, key=cards.__getitem__)
+            raise ValueError(f'more than {self.copies} of card: {card} '
+                             f'(x{cards[card]})')
+        if cards.jokers > self.jokers:
+            raise ValueError(f'more than {self.jokers} jokers: {cards.jokers}')
+
+DEFAULT_DECK = Deck(copies=2, jokers=0)
+
+
+class Cards:
+    '''An immutable multiset of cards stored as the count of each card in
+    `CARDS`.
+
+    Iterating gives the card names in `CARDS` order and `str()` gives them
+    sorted and comma-separated.  Cards can be added and subtracted (negative
+    counts are dropped like `Counter`) and are cheap to hash and compare.
+    `bytes(cards)` and `Cards.from_bytes()` give a compact 52-byte form (with
+    a 53rd byte for the number of jokers if there are any).
+    '''
+    __slots__ = ('_counts',)
+
+    def __init__(self, cards=()):
+        '''Accepts card names, a comma-separated string (see `parse_cards`),
+        a mapping of card names to counts, or another Cards.'''
+        if isinstance(cards, Cards):
+            self._counts = cards._counts
+            return
+        if isinstance(cards, str):
+            cards = parse_cards(cards)
+            self._counts = cards._counts
+            return
+        counts = bytearray(len(_SLOTS))
+        items = cards.items() if hasattr(cards, 'items') else (
+            (card, 1) for card in cards)
+        for card, n in items:
+            i = _SLOTS.get(card)
+            if i is None:
+                raise ValueError(f'invalid card: {card}')
+            if n > 0:
+                counts[i] += n
+        self._counts = bytes(counts)
+
+    @classmethod
+    def from_counts(cls, counts, jokers=0):
+        '''Makes Cards from an array of the count of each card in `CARDS`.'''
+        return cls.from_bytes(
+            bytes(min(max(int(n), 0), 255) for n in counts) + bytes([jokers]))
+
+    @classmethod
+    def from_bytes(cls, data):
+        cards = cls.__new__(cls)
+        cards._counts = bytes(data)[:len(_SLOTS)].ljust(len(_SLOTS), b'\0')
+        return cards
+
+    @property
+    def counts(self):
+        '''Read-only uint8 array of the count of each card in `CARDS` (not
+        including jokers).'''
+        import numpy as np
+        return np.frombuffer(self._counts, dtype=np.uint8,
+                             count=len(CARDS))
+
+    @property
+    def jokers(self):
+        '''The number of jokers.'''
+        return self._counts[-1]
+
+    def max_count(self):
+        '''The most copies of any card (not counting jokers).'''
+        return max(self._counts[:len(CARDS)])
+
+    def elements(self):
+        return iter(self)
+
+    def __bytes__(self):
+        if self.jokers:
+            return self._counts
+        return self._counts[:len(CARDS)]
+
+    def __iter__(self):
+        for card, n in zip(_SLOTS, self._counts):
+            for _ in range(n):
+                yield card
+
+    def __len__(self):
+        return sum(self._counts)
+
+    def __bool__(self):
+        return any(self._counts)
+
+    def __getitem__(self, card):
+        return self._counts[_SLOTS[card]]
+
+    def __contains__(self, card):
+        return card in _SLOTS and self[card] > 0
+
+    def __add__(self, other):
+        other = Cards(other)
+        return Cards.from_counts(
+            a + b for a, b in zip(self._counts, other._counts))
+
+    def __sub__(self, other):
+        other = Cards(other)
+        return Cards.from_counts(
+            a - b for a, b in zip(self._counts, other._counts))
+
+    def __le__(self, other):
+        '''Returns if self is a subset of other.'''
+        other = Cards(other)
+        return all(a <= b for a, b in zip(self._counts, other._counts))
+
+    def __eq__(self, other):
+        if not isinstance(other, Cards):
+            return NotImplemented
+        return self._counts == other._counts
+
+    def __hash__(self):
+        return hash(self._counts)
+
+    def __str__(self):
+        '''Returns the cards sorted nicely and comma-separated.'''
+        names = list(self)[:len(self) - self.jokers]
+        # Put aces after kings when there are kings but no twos
+        n_aces = sum(self._counts[:len(SUITS)])
+        if (n_aces and any(self._counts[len(CARDS)-len(SUITS):len(CARDS)])
+                and not any(self._counts[len(SUITS):2*len(SUITS)])):
+            names = names[n_aces:] + names[:n_aces]
+        return ','.join(names + [JOKER] * self.jokers)
+
+    def __repr__(self):
+        return f"Cards('{self}')"
+
+def sort_key(s):
+    s = s.lower()
+    s = s.replace('a', '1').replace('q', 'i')
+    s = s.replace('j', 'h').replace('s', 'b').replace('t', 'b')
+    # Sort sequences after sets
+    if ',' in s and not all(ss[:1] == s[:1] for ss in s.split(',')):
+        s = 'z_' + s
+    return s
+
+def sort_key_k(s):
+    return sort_key(s).replace('1', 'l')
+
+def sorted_cards(cards):
+    '''Returns the cards sorted nicely.'''
+    cards = list(cards)
+    if (any('k' in card for card in cards)
+            and not any('2' in card for card in cards)):
+        cards.sort(key=sort_key_k)
+    else:
+        cards.sort(key=sort_key)
+    return cards
+
+def cards_to_str(cards):
+    '''Converts a list of card names to a sorted, comma-separated, printable
+    string.'''
+    return ','.join(sorted_cards(cards))
+
+
+class ParseError(RuntimeError): pass
+
+def parse_cards(cards_str):
+    '''Parse a comma-separated list of cards into Cards.
+
+    Converts common variants of card names such as 10s->ts, ah->1h, 0d->td
+    K♥️ ->kh.  Jokers are jk (or joker or 🃏).
+    '''
+    # Normalize
+    cards_nrm = cards_str.lower()
+    cards_nrm = cards_nrm.replace('joker', JOKER).replace('🃏', JOKER)
+    cards_nrm = cards_nrm.replace('10', 't').replace('a', '1').replace('0', 't')
+    cards_nrm = cards_nrm.replace('♠️', 's').replace('♣️', 'c')
+    cards_nrm = cards_nrm.replace('♦️', 'd').replace('♥️', 'h')
+    # Parse
+    cards = [s.strip() for s in cards_nrm.split(',')]
+    # Verify no invalid cards
+    for i, card in enumerate(cards):
+        if card and card not in _SLOTS:
+            raise ParseError(f'''Invalid card "{cards_str.split(',')[i]}"''')
+    return Cards(card for card in cards if card)
+
+def input_cards(input_msg, shortcuts=None):
+    '''Prompts for input of a list of cards and returns the parsed Cards.
+
+    If the input is invalid, prints an error and prompts again.
+    If 'x' is entered, raises a KeyboardInterrupt.
+    If a shortcuts dictionary is given and `user_input in shortcuts`
+    shortcuts[user_input] will be parsed instead (ensuring user_input is
+    lowercase).
+    '''
+    while True:
+        try:
+            cards_str = input(input_msg)
+            cards_str = cards_str.strip().lower()
+            if cards_str == 'x':
+                raise KeyboardInterrupt()
+            if shortcuts and cards_str in shortcuts:
+                cards_str = shortcuts[cards_str]
+            return parse_cards(cards_str)
+        except ParseError as e:
+            print(str(e), file=sys.stderr)
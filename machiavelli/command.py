@@ -1,9 +1,14 @@
 import argparse
-from collections import Counter
+import collections
+import json
+import sys
+import threading
 
-from .solver import (
-    Solver, parse_cards, input_cards, ParseError, sorted_cards, cards_to_str
-)
+# Only import the light card module here so --help and the first prompt don't
+# wait for numpy and scipy (or cvxpy).  See `preload_solver()`.
+from .cards import BACKENDS, Deck, backend_error, Cards, input_cards, ParseError
+
+LOOKAHEAD_TIME = 0.5  # Seconds spent on --lookahead after each solve
 
 try:
     import termcolor
@@ -14,55 +19,106 @@ else:
     NO_COLOR = False
 
 
-def main_inner(table='', hand='', pretty=True, color=True, emoji=False):
+def main_inner(table='', hand='', pretty=True, color=True, emoji=False,
+               backend='milp', cross_check=False, persistent=False,
+               cache_file=None, stats=False, time_limit=None,
+               lookahead=False, lp_first=False, speculate=True, decks=2,
+               jokers=0, lookahead_time=LOOKAHEAD_TIME):
+    '''Runs the interactive game loop.  `table` may also be a
+    `solver.Position` (then `hand` is ignored).  The game is played with
+    `decks` copies of each card and `jokers`.
+
+    With `speculate`, the likely next positions are solved while waiting
+    for input (see `speculate.Speculator`).'''
+    position = None
+    if table is not None and not isinstance(table, (str, Cards)):
+        position = table
+        table, hand = position.table, position.hand
     table = table or ''
     hand = hand or ''
 
-    # Configure solver
-    solver = Solver(pretty=pretty, color=color, emoji=emoji)
+    # Import the solver while the user types
+    preload = preload_solver(backend)
+
+    def make_solver():
+        preload.join()
+        from .solver import Solver
+        from .cache import SolutionCache
+        solver = Solver(pretty=pretty, color=color, emoji=emoji,
+                        backend=backend, cross_check=cross_check,
+                        persistent=persistent, lp_first=lp_first,
+                        cache=SolutionCache(path=cache_file),
+                        deck=Deck(decks, jokers))
+        if stats:
+            solver.hooks.append(solver.print_stats)
+        return solver
 
     def print_game_state():
-        last_hand_str = ','.join(sorted_cards(hand.elements()))
-        last_table_str = ','.join(sorted_cards(table.elements()))
+        last_hand_str = str(hand)
+        last_table_str = str(table)
         if not last_table_str:
             last_table_str = "''"
         if last_hand_str:
             last_hand_str = ' '+last_hand_str
-        print(f'Current game state: machiavelli {last_table_str}{last_hand_str}')
+        deck_args = ''
+        if decks != 2:
+            deck_args += f' --decks {decks}'
+        if jokers:
+            deck_args += f' --jokers {jokers}'
+        print(f'Current game state: machiavelli{deck_args} {last_table_str}'
+              f'{last_hand_str}')
 
     # Get initial hand and table state
     try:
-        hand = Counter(parse_cards(hand))
-        table = Counter(parse_cards(table))
+        hand = Cards(hand)
+        table = Cards(table)
     except ParseError as e:
-        solver.print_err(str(e), type(e))
+        print_error(str(e), color)
         return
     if not hand and not table:
         h = input_cards('Enter starting hand: ')
-        p = []
+        p = Cards()
         t = input_cards('Enter other plays: ')
-        hand += Counter(h)
-        hand -= Counter(p)
-        table += Counter(p)
-        table += Counter(t)
+        hand += h
+        hand -= p
+        table += p
+        table += t
         print_game_state()
+    solver = make_solver()
+    if position is None:
+        from .solver import Position
+        position = Position(table, hand)
+    speculator = None
+    if speculate:
+        from .speculate import Speculator
+        speculator = Speculator(solver)
 
     # Loop for each game round
     while True:
         # Solve the table then table+hand
         sol = None
+        optimal = False
+        if speculator is not None:
+            speculator.check(position)
         try:
-            sol = solver.play_hand(table, hand)
+            sol = solver.play_hand(position, time_limit=time_limit)
+            optimal = solver.stats.get('optimal', False)
+            if lookahead:
+                print_lookahead(solver.lookahead(
+                    position, time_limit=lookahead_time), sol)
         except (KeyboardInterrupt, EOFError):
             print()
             print('Solver Canceled')
+        if speculator is not None:
+            if stats:
+                print(f'speculation: {speculator.hits}/{speculator.checked} '
+                      f'positions solved ahead', file=sys.stderr)
+            speculator.start(position, sol, optimal)
 
         print()
         h = input_cards('Enter drawn card(s) (or blank): ')
         if sol:
-            best_cards = Counter(card for group in sol for card in group)
-            best_cards.subtract(table)
-            best = cards_to_str(best_cards.elements())
+            best = str(sol.played)
         else:
             best = ''
         if best:
@@ -72,25 +128,257 @@ def main_inner(table='', hand='', pretty=True, color=True, emoji=False):
             p = input_cards(f'Enter my last play (or blank): ',
                             shortcuts={'b': '', 'best': ''})
         t = input_cards('Enter other plays: ')
-        hand += Counter(h)
-        hand -= Counter(p)
-        table += Counter(p)
-        table += Counter(t)
+        if speculator is not None:
+            # Finish the speculative solve before printing anything
+            speculator.stop()
+        position.add(hand=h)
+        position.play(p)
+        position.add(table=t)
+        table, hand = position.table, position.hand
 
         # Print current game state
         print_game_state()
 
-def main(table='', hand='', pretty=False, color=True, emoji=False):
+def print_error(msg, color=True):
+    '''Prints an error like `Solver.print_err` without loading the
+    solver.'''
+    if color and not NO_COLOR:
+        print(termcolor.colored(f'Error: {msg}', 'red'), file=sys.stderr)
+    else:
+        print(f'Error: {msg}', file=sys.stderr)
+
+def print_lookahead(outcomes, sol, n_best=5):
+    '''Prints the expected number of cards playable after drawing a card
+    (over the draws solved in time) and the draws that would play the
+    most.'''
+    known = [o for o in outcomes if o.playable is not None]
+    if not known:
+        return
+    expected = (sum(o.probability * o.playable for o in known)
+                / sum(o.probability for o in known))
+    now = len(sol.played) if sol else 0
+    best = [o for o in known if o.playable > now][:n_best]
+    msg = f'If you draw: {expected:.1f} cards playable on average (now {now})'
+    if best:
+        msg += ', best draws: ' + ', '.join(f'{o.draw} ({o.playable})'
+                                            for o in best)
+    if len(known) < len(outcomes):
+        msg += f' ({len(outcomes) - len(known)} draws not solved in time)'
+    print(msg)
+
+def preload_solver(backend):
+    '''Starts importing the solver module (and CVXPY if it will be used) in a
+    background thread and returns the thread.'''
+    def load():
+        from . import solver
+        # Every backend uses SciPy's MILP solver for time-limited solves
+        import scipy.optimize
+        if backend in ('cvxpy', 'portfolio'):
+            try:
+                import cvxpy
+            except ImportError:
+                pass  # Portfolio races without the CVXPY solvers
+    thread = threading.Thread(target=load, daemon=True)
+    thread.start()
+    return thread
+
+def main(table='', hand='', pretty=False, color=True, emoji=False,
+         backend='milp', cross_check=False, persistent=False,
+         cache_file=None, stats=False, time_limit=None, lookahead=False,
+         lookahead_time=LOOKAHEAD_TIME,
+         lp_first=False, speculate=True, decks=2, jokers=0):
     try:
-        main_inner(table, hand, pretty=pretty, color=color, emoji=emoji)
+        main_inner(table, hand, pretty=pretty, color=color, emoji=emoji,
+                   backend=backend, cross_check=cross_check,
+                   persistent=persistent, cache_file=cache_file, stats=stats,
+                   time_limit=time_limit, lookahead=lookahead,
+                   lookahead_time=lookahead_time,
+                   lp_first=lp_first, speculate=speculate, decks=decks,
+                   jokers=jokers)
     except (KeyboardInterrupt, EOFError):
         print()
         print('Quit')
 
 
+def solve_batch(lines, out, workers=None, backend='milp', cache_file=None,
+                deck=None):
+    '''Solves positions given as JSON lines like
+    `{"table": "7c,8c,9c", "hand": "1c,2c,3c,kh"}` and writes one JSON line
+    per position to out in the same order.
+
+    Each result has the solution `groups`, the cards to `play` from the hand
+    and the `hand` left after playing (or `"groups": null` if there is no
+    valid grouping of the table).  Invalid lines and positions with more
+    cards than the deck give an `error` instead.  An `id` field is copied to
+    the result.
+    '''
+    from .solver import Solver, Position
+    from .cache import SolutionCache
+    from .serve import solution_response
+    cache = SolutionCache(path=cache_file) if cache_file else None
+    solver = Solver(quiet=True, backend=backend, cache=cache,
+                    deck=deck or Deck())
+
+    records = collections.deque()
+    def positions():
+        for line in lines:
+            if not line.strip():
+                continue
+            record = {}
+            try:
+                data = json.loads(line)
+                if not isinstance(data, dict):
+                    raise ValueError('position must be a JSON object')
+                if 'id' in data:
+                    record['id'] = data['id']
+                position = Position(data.get('table') or '',
+                                    data.get('hand') or '')
+                solver.deck.check(position.cards)
+                record['position'] = position
+            except (ValueError, TypeError, ParseError) as e:
+                record['error'] = str(e)
+            records.append(record)
+            if 'position' in record:
+                yield record['position']
+
+    def write(record, sol=None):
+        position = record.pop('position', None)
+        if position is not None:
+            record.update(solution_response(sol))
+        out.write(json.dumps(record) + '\n')
+        out.flush()
+
+    for sol in solver.solve_many(positions(), workers=workers):
+        while 'error' in records[0]:
+            write(records.popleft())
+        write(records.popleft(), sol)
+    while records:
+        write(records.popleft())
+
+def run_batch(argv):
+    parser = argparse.ArgumentParser(prog='machiavelli batch', description=
+        'Solves positions read as JSON lines '
+        '(e.g. {"table": "7c,8c,9c", "hand": "1c,2c,3c,kh"}) '
+        'and writes the solutions as JSON lines in the same order.')
+    parser.add_argument('file', nargs='?', help=
+        'The file of positions (default: stdin)')
+    parser.add_argument('-j', '--workers', type=int, default=None, help=
+        'The number of solver processes (default: one per CPU)')
+    parser.add_argument('--backend', choices=BACKENDS, default='milp', help=
+        'The solver used to find the best play (default: milp)')
+    parser.add_argument('--cache', metavar='FILE', dest='cache_file', help=
+        'Keeps solutions in this sqlite file to reuse them in later runs')
+    parser.add_argument('--decks', type=int, default=2, help=
+        'The number of decks played with (default: 2)')
+    parser.add_argument('--jokers', type=int, default=0, help=
+        'The number of jokers played with (default: 0)')
+    args = parser.parse_args(argv)
+    parse_backend(parser, args)
+    deck = parse_deck(parser, args)
+    if args.file is None or args.file == '-':
+        solve_batch(sys.stdin, sys.stdout, workers=args.workers,
+                    backend=args.backend, cache_file=args.cache_file,
+                    deck=deck)
+    else:
+        with open(args.file) as f:
+            solve_batch(f, sys.stdout, workers=args.workers,
+                        backend=args.backend, cache_file=args.cache_file,
+                        deck=deck)
+
+def run_simulate(argv):
+    from .simulate import POLICIES, simulate, format_summary
+    parser = argparse.ArgumentParser(prog='machiavelli simulate', description=
+        'Plays automated games and reports speed and win statistics.')
+    parser.add_argument('-n', '--games', type=int, default=10, help=
+        'The number of games to play (default: 10)')
+    parser.add_argument('-p', '--players', nargs='+', default=['best', 'best'],
+        choices=sorted(POLICIES), help=
+        'The policy of each player (default: best best)')
+    parser.add_argument('--seed', type=int, default=0, help=
+        'The seed of the first game (default: 0)')
+    parser.add_argument('--hand-size', type=int, default=13, help=
+        'The number of cards dealt to each player (default: 13)')
+    parser.add_argument('-j', '--workers', type=int, default=1, help=
+        'The number of processes playing games (default: 1)')
+    parser.add_argument('--backend', choices=BACKENDS, default='milp', help=
+        'The solver used by the players (default: milp)')
+    parser.add_argument('--check', action='store_true', help=
+        'Verifies that every play leaves the table validly grouped')
+    parser.add_argument('--json', action='store_true', help=
+        'Prints the statistics as JSON')
+    parser.add_argument('--decks', type=int, default=2, help=
+        'The number of decks played with (default: 2)')
+    parser.add_argument('--jokers', type=int, default=0, help=
+        'The number of jokers played with (default: 0)')
+    args = parser.parse_args(argv)
+    parse_backend(parser, args)
+    parse_deck(parser, args)
+    summary = simulate(args.games, args.players, seed=args.seed,
+                       workers=args.workers, hand_size=args.hand_size,
+                       backend=args.backend, check_plays=args.check,
+                       decks=args.decks, jokers=args.jokers)
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        print(format_summary(summary, args.players))
+
+def run_serve(argv):
+    from .serve import DEFAULT_PORT, serve
+    parser = argparse.ArgumentParser(prog='machiavelli serve', description=
+        'Keeps solvers running and answers JSON line requests '
+        '(e.g. {"op": "solve", "table": "7c,8c,9c", "hand": "1c,2c,3c,kh"}) '
+        'on a local socket.  See machiavelli/serve.py for the requests.')
+    parser.add_argument('--socket', metavar='PATH', help=
+        'Listens on a Unix socket at this path instead of TCP')
+    parser.add_argument('--host', default='127.0.0.1', help=
+        'The TCP address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=
+        f'The TCP port to listen on (default: {DEFAULT_PORT})')
+    parser.add_argument('-j', '--workers', type=int, default=None, help=
+        'The number of solver processes (default: one per CPU)')
+    parser.add_argument('--backend', choices=BACKENDS, default='milp', help=
+        'The solver used to find the best play (default: milp)')
+    parser.add_argument('--cache', metavar='FILE', dest='cache_file', help=
+        'Keeps solutions in this sqlite file to reuse them in later runs')
+    parser.add_argument('--decks', type=int, default=2, help=
+        'The number of decks played with (default: 2)')
+    parser.add_argument('--jokers', type=int, default=0, help=
+        'The number of jokers played with (default: 0)')
+    args = parser.parse_args(argv)
+    parse_backend(parser, args)
+    deck = parse_deck(parser, args)
+    serve(args.host, args.port, args.socket, workers=args.workers,
+          backend=args.backend, cache_file=args.cache_file, deck=deck,
+          ready=lambda address: print(f'Listening on {address}',
+                                      file=sys.stderr, flush=True))
+
+def parse_backend(parser, args):
+    '''Exits with an error if the --backend option can't be used here.'''
+    if backend_error(args.backend):
+        parser.error(backend_error(args.backend))
+
+def parse_deck(parser, args):
+    '''Returns the `Deck` given by the --decks and --jokers options.'''
+    try:
+        return Deck(args.decks, args.jokers)
+    except ValueError as e:
+        parser.error(str(e))
+
 def run_from_command_line():
+    if sys.argv[1:2] == ['serve']:
+        run_serve(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ['batch']:
+        run_batch(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ['simulate']:
+        run_simulate(sys.argv[2:])
+        return
     parser = argparse.ArgumentParser(
-        description='Solves the card game Machiavelli.')
+        description='Solves the card game Machiavelli.  '
+                    'Run "machiavelli batch -h" to solve many positions, '
+                    '"machiavelli simulate -h" to play automated games or '
+                    '"machiavelli serve -h" to run a solver server.')
     parser.add_argument('table', type=str, nargs='?', help=
         'The cards currently played on the table.  '
         'Example: 1c,2c,3c,4c,7c,8c,9c')
@@ -109,9 +397,50 @@ def run_from_command_line():
         'Prints cards suits using Emoji (♠️ , ♣️ , ♦️ , ♥️ ) intead of (s, c, d, h)')
     parser.add_argument('--noemoji', action='store_false', dest='emoji', help=
         'Prints cards suits using the letters s, c, d, h for spades, clubs, diamonds, hearts')
+    parser.add_argument('--backend', choices=BACKENDS, default='milp', help=
+        'The solver used to find the best play (default: milp).  portfolio '
+        'races every installed MIP solver in parallel processes')
+    parser.add_argument('--cross-check', action='store_true', help=
+        'Solves with every backend and reports any difference')
+    parser.add_argument('--persistent', action='store_true', help=
+        'Builds the integer program once and reuses it for every solve')
+    parser.add_argument('--lp-first', action='store_true', help=
+        'Solves the LP relaxation first and uses it if it is integral (it '
+        'usually is), only searching further if not')
+    parser.add_argument('--cache', metavar='FILE', dest='cache_file', help=
+        'Keeps solutions in this sqlite file to reuse them in later sessions')
+    parser.add_argument('--time-limit', type=float, metavar='SECONDS', help=
+        'Shows the best play found in about this time instead of waiting '
+        'for the best possible play')
+    parser.add_argument('--stats', action='store_true', help=
+        'Prints the time of each solver phase and other stats after each '
+        'solve (set MACHIAVELLI_PROFILE=DIR to also save cProfile output)')
+    parser.add_argument('--lookahead', action='store_true', help=
+        'After each solve, shows how many cards could be played after '
+        'drawing each unseen card')
+    parser.add_argument('--lookahead-time', type=float,
+        default=LOOKAHEAD_TIME, metavar='SECONDS', help=
+        'Seconds spent on --lookahead after each solve (the least likely '
+        'draws are left out when time runs out; default %(default)s)')
+    parser.add_argument('--speculate', action='store_true', default=True,
+        help='Solves the likely next positions while waiting for input so '
+        'the next solve is instant (default)')
+    parser.add_argument('--nospeculate', action='store_false',
+                        dest='speculate', help='Disables --speculate')
+    parser.add_argument('--decks', type=int, default=2, help=
+        'The number of decks played with, up to 4 (default: 2)')
+    parser.add_argument('--jokers', type=int, default=0, help=
+        'The number of jokers played with (default: 0).  Enter them as jk')
 
     args = parser.parse_args()
+    parse_backend(parser, args)
+    parse_deck(parser, args)
     if args.color:
         colorama.init()
     main(args.table, args.hand, pretty=args.pretty, color=args.color,
-         emoji=args.emoji)
+         emoji=args.emoji, backend=args.backend, cross_check=args.cross_check,
+         persistent=args.persistent, cache_file=args.cache_file,
+         stats=args.stats, time_limit=args.time_limit,
+         lookahead=args.lookahead,
+         lookahead_time=args.lookahead_time, lp_first=args.lp_first,
+         speculate=args.speculate, decks=args.decks, jokers=args.jokers)
@@ -0,0 +1,387 @@
+'''Pure Python branch-and-bound solver for the card grouping program.
+
+This solves the same integer program that `Solver.solve` gives to SciPy or CVXPY:
+choose a number of copies `x[g] <= group_max[g]` of each possible group such
+that each card `c` is used between `card_min[c]` and `card_max[c]` times,
+maximizing the number of cards used and then minimizing the number of groups.
+
+The columns of `card_mat` must be the 52 card types in `CARDS` order
+(column = rank * 4 + suit).  The search sweeps through the ranks from ace to
+king (and the ace again for ace-high sequences), deciding at each rank which
+copies of each card extend or start a sequence and which form sets.  Open
+sequences are tracked per suit as "lanes" (one per copy of the deck) holding
+the length of the sequence so far, so the search state at each rank is small.
+'''
+
+import functools
+import itertools
+import time
+
+import numpy as np
+
+
+N_RANKS = 13
+N_SUITS = 4
+ACE_HIGH = N_RANKS  # Rank index of the ace after the king
+
+# Lane codes: 0 = no open sequence, 1 and 2 = sequence of that many cards so
+# far, 3 = sequence of 3+ cards, 4 = sequence of 3+ cards that started with a
+# low ace (so it can't continue to a high ace)
+CLOSABLE = (0, 3, 4)
+
+# The sets that can be made from the four suits
+SET_TYPES = [
+    suits
+    for n in (4, 3)
+    for suits in itertools.combinations(range(N_SUITS), n)
+]
+
+
+@functools.lru_cache(maxsize=None)
+def set_decompositions(copies):
+    '''Returns {suit_usage: (num_sets, set_types)} for the cheapest way to use
+    the given number of cards of each suit in sets of one rank.
+
+    Usages are built up one set at a time (fewest sets first) so the table
+    stays small for three or four decks.'''
+    table = {(0,) * N_SUITS: (0, ())}
+    frontier = [(0,) * N_SUITS]
+    while frontier:
+        next_frontier = []
+        for usage in frontier:
+            n_sets, set_types = table[usage]
+            for suits in SET_TYPES:
+                bigger = list(usage)
+                for s in suits:
+                    bigger[s] += 1
+                bigger = tuple(bigger)
+                if max(bigger) > copies or bigger in table:
+                    continue
+                table[bigger] = n_sets + 1, set_types + (suits,)
+                next_frontier.append(bigger)
+        frontier = next_frontier
+    return table
+
+@functools.lru_cache(maxsize=None)
+def best_sets(t_min, t_max, copies):
+    '''Returns (score, suit_usage) for the best sets using between t_min and
+    t_max cards of each suit or None if there is no valid choice.'''
+    table = set_decompositions(copies)
+    best = None
+    for usage in itertools.product(*(range(lo, hi+1)
+                                     for lo, hi in zip(t_min, t_max))):
+        if usage not in table:
+            continue
+        score = sum(usage) * 1024 - table[usage][0]
+        if best is None or score > best[0]:
+            best = score, usage
+    return best
+
+def next_code(code, action, rank, ace_high):
+    '''Returns the lane code after an action at the given rank.'''
+    if action == 's':
+        return 1
+    if action == 'c':
+        return 0
+    if action == 'e' and code == 1:
+        return 2
+    if action == 'e' and code == 2:
+        # A 2-card sequence before rank 2 started with a low ace
+        return 4 if rank == 2 and ace_high else 3
+    return code
+
+@functools.lru_cache(maxsize=None)
+def lane_options(lanes, avail, rank, ace_high):
+    '''Returns the ways to continue the open sequences of one suit.
+
+    Each option is (actions, new_lanes, cards_used, sequences_started) where
+    actions has one of 'e'xtend, 's'tart, 'c'lose or 'i'dle for each lane.
+    '''
+    options = {}
+    per_lane = []
+    for code in lanes:
+        if code == 0:
+            acts = ('i',) if rank == ACE_HIGH else ('s', 'i')
+        elif code in (1, 2):
+            acts = ('e',)
+        elif code == 4 and rank == ACE_HIGH:
+            acts = ('c',)
+        else:
+            acts = ('e', 'c')
+        per_lane.append(acts)
+    for actions in itertools.product(*per_lane):
+        used = sum(a in 'es' for a in actions)
+        if used > avail:
+            continue
+        new_lanes = [
+            next_code(code, a, rank, ace_high)
+            for code, a in zip(lanes, actions)
+        ]
+        if rank == ACE_HIGH and any(c not in CLOSABLE for c in new_lanes):
+            continue  # Sequences must be 3+ cards when they end
+        key = tuple(sorted(new_lanes)), used, actions.count('s')
+        if key not in options:
+            options[key] = actions
+    return [
+        (actions, new_lanes, used, starts)
+        for (new_lanes, used, starts), actions in options.items()
+    ]
+
+def branch_and_bound(card_mat, card_min, card_max, group_max,
+                     incumbent=None, stats=None, deadline=None, cutoff=None,
+                     upper_bound=None):
+    '''Exactly solves the grouping program with a depth-first search.
+
+    Placeable cards are tracked as bitmasks, branches are pruned with an
+    upper bound on the cards that can still be placed, and search states
+    already reached with a better partial score are skipped.  Only groups in
+    `card_mat` (with `group_max > 0`) are used.
+
+    If `incumbent` (a valid solution) is given, only better solutions are
+    searched for, which prunes most of the search when it is already good.
+    If a dict is given as `stats`, the number of search `nodes` is stored in
+    it.  If the `deadline` (a `time.perf_counter()` time) passes, the search
+    stops early with the best solution found (or None if there is none yet)
+    and `stats['complete']` is False.
+
+    With a `cutoff` score (cards used * 1024 - groups used), only solutions
+    scoring more are searched for and None is returned if there is none.
+    With an `upper_bound` on the score (such as from the LP relaxation), the
+    search stops as soon as a solution reaching it is found.
+
+    Returns the number of copies of each group or None if no valid grouping
+    exists.
+    '''
+    if hasattr(card_mat, 'toarray'):
+        card_mat = card_mat.toarray()  # Sparse matrix
+    card_mat = np.asarray(card_mat, dtype=bool)
+    card_min = np.asarray(card_min, dtype=int)
+    card_max = np.asarray(card_max, dtype=int)
+    group_max = np.asarray(group_max, dtype=int)
+    n_groups, n_cards = card_mat.shape
+    if n_cards != N_RANKS * N_SUITS:
+        raise ValueError('card_mat must have one column per card in CARDS')
+    copies = max(int(card_max.max(initial=0)), 1)
+
+    # Index the allowed groups and find cards that can be placed at all
+    rows = {}
+    placeable = 0
+    for g in range(n_groups):
+        if group_max[g] > 0:
+            cols = np.flatnonzero(card_mat[g])
+            rows.setdefault(frozenset(cols.tolist()), g)
+            for c in cols:
+                placeable |= 1 << int(c)
+    required = sum(1 << int(c) for c in np.flatnonzero(card_min > 0))
+    if required & ~placeable:
+        return None  # Some required card can't be placed in any group
+
+    avail = [[0] * N_SUITS for _ in range(N_RANKS)]
+    need = [[0] * N_SUITS for _ in range(N_RANKS)]
+    for c in range(n_cards):
+        if placeable >> c & 1:
+            avail[c // N_SUITS][c % N_SUITS] = int(card_max[c])
+        need[c // N_SUITS][c % N_SUITS] = int(card_min[c])
+    # Suits where an ace can follow the queen and king
+    ace_high = tuple(
+        avail[0][s] > 0 and avail[11][s] > 0 and avail[12][s] > 0
+        for s in range(N_SUITS)
+    )
+    set_ok = [sum(a > 0 for a in avail[r]) >= 3 for r in range(N_RANKS)]
+
+    def suit_inputs(s, r, low_s):
+        '''Returns the (available, required) count of card (r, s).'''
+        if r == ACE_HIGH:
+            if not ace_high[s]:
+                return 0, 0
+            return avail[0][s] - low_s, max(0, need[0][s] - low_s)
+        if r == 0 and ace_high[s]:
+            return avail[0][s], 0  # Required aces may be placed after the king
+        return avail[r][s], need[r][s]
+
+    suit_memo = {}
+    def suit_bound(s, r, lanes_s, low_s):
+        '''Upper bound on four times the score of suit s from rank r onward,
+        allowing any card to join a set when three suits have that rank.
+
+        Each card in a set is charged a quarter of a group.'''
+        if r > ACE_HIGH:
+            return 0
+        key = s, r, lanes_s, low_s
+        if key in suit_memo:
+            return suit_memo[key]
+        a, m = suit_inputs(s, r, low_s)
+        best = None
+        for _, new_lanes, used, starts in lane_options(lanes_s, a, r,
+                                                       ace_high[s]):
+            t_max = a - used if r < N_RANKS and set_ok[r] else 0
+            if m - used > t_max:
+                continue
+            ts = range(t_max+1) if r == 0 and ace_high[s] else [t_max]
+            for t in ts:
+                rest = suit_bound(s, r+1, new_lanes,
+                                  used + t if r == 0 and ace_high[s]
+                                  else low_s)
+                if rest is not None:
+                    score = (used + t) * 4096 - starts * 4 - t + rest
+                    if best is None or score > best:
+                        best = score
+        suit_memo[key] = best
+        return best
+
+    def bound(r, lanes, low):
+        '''Upper bound on four times the score from rank r onward or None if
+        no valid grouping can be completed.'''
+        total = 0
+        for s in range(N_SUITS):
+            b = suit_bound(s, r, lanes[s], low[s])
+            if b is None:
+                return None
+            total += b
+        return total
+
+    def children(r, lanes, low):
+        '''Yields (score, next_lanes, next_low, decision) for rank r.'''
+        per_suit = []
+        for s in range(N_SUITS):
+            a, m = suit_inputs(s, r, low[s])
+            opts = []
+            for actions, new_lanes, used, starts in lane_options(
+                    lanes[s], a, r, ace_high[s]):
+                t_min, t_max = max(0, m - used), a - used
+                if r == ACE_HIGH:
+                    t_max = 0  # No sets of high aces
+                if t_min > t_max:
+                    continue
+                if r == 0 and ace_high[s]:
+                    # The number of low aces limits the high aces later
+                    for t in range(t_min, t_max+1):
+                        opts.append((actions, new_lanes, used, starts, t, t))
+                else:
+                    opts.append((actions, new_lanes, used, starts, t_min,
+                                 t_max))
+            if not opts:
+                return
+            per_suit.append(opts)
+        for combo in itertools.product(*per_suit):
+            sets = best_sets(tuple(o[4] for o in combo),
+                             tuple(o[5] for o in combo), copies)
+            if sets is None:
+                continue
+            set_score, usage = sets
+            score = (set_score
+                     + sum(o[2] for o in combo) * 1024
+                     - sum(o[3] for o in combo))
+            next_lanes = tuple(o[1] for o in combo)
+            next_low = low
+            if r == 0:
+                next_low = tuple(
+                    o[2] + t if ace_high[s] else 0
+                    for s, (o, t) in enumerate(zip(combo, usage))
+                )
+            yield score, next_lanes, next_low, (
+                tuple(o[0] for o in combo), usage)
+
+    best_score = None
+    best_path = None
+    if incumbent is not None:
+        incumbent = np.asarray(incumbent, dtype=int)
+        used = card_mat.T.astype(int).dot(incumbent)
+        if (np.all(used >= card_min) and np.all(used <= card_max)
+                and np.all(incumbent <= group_max)):
+            best_score = int(used.sum()) * 1024 - int(incumbent.sum())
+        else:
+            incumbent = None
+    if cutoff is not None and (best_score is None or cutoff > best_score):
+        best_score = cutoff
+        incumbent = None
+    path = []
+    seen = {}
+    nodes = 0
+    stopped = False
+    done = False  # Reached the upper bound
+
+    def visit(r, lanes, low, score):
+        nonlocal best_score, best_path, nodes, stopped, done
+        nodes += 1
+        # Nodes take about a millisecond on large tables so check each one
+        if deadline is not None and time.perf_counter() >= deadline:
+            stopped = True
+        if stopped or done:
+            return
+        key = r, lanes, low
+        if seen.get(key, score-1) >= score:
+            return
+        seen[key] = score
+        if r > ACE_HIGH:
+            best_score = score
+            best_path = list(path)
+            done = upper_bound is not None and score >= upper_bound
+            return
+        # Try the most promising children first to find a good solution early
+        options = []
+        for step, next_lanes, next_low, decision in children(r, lanes, low):
+            upper = bound(r+1, next_lanes, next_low)
+            if upper is not None:
+                options.append(((score + step) * 4 + upper, step, next_lanes,
+                                next_low, decision))
+        options.sort(key=lambda o: -o[0])
+        for upper, step, next_lanes, next_low, decision in options:
+            if best_score is not None and upper <= best_score * 4:
+                break
+            path.append(decision)
+            visit(r+1, next_lanes, next_low, score + step)
+            path.pop()
+
+    empty = ((0,) * copies,) * N_SUITS
+    if bound(0, empty, (0,) * N_SUITS) is not None:
+        visit(0, empty, (0,) * N_SUITS, 0)
+    if stats is not None:
+        stats['nodes'] = nodes
+        stats['complete'] = not stopped
+    if best_path is None:
+        return None if incumbent is None else incumbent.copy()
+
+    # Replay the decisions to recover the groups
+    x = np.zeros(n_groups, dtype=int)
+    def add_group(cols):
+        g = rows.get(frozenset(cols))
+        if g is None:
+            raise ValueError(f'group not in card_mat: {sorted(cols)}')
+        x[g] += 1
+    def add_seq(s, start, end):
+        add_group([(r % N_RANKS) * N_SUITS + s for r in range(start, end+1)])
+
+    lanes = [[[0, None] for _ in range(copies)] for _ in range(N_SUITS)]
+    for r, (actions, usage) in enumerate(best_path):
+        for s in range(N_SUITS):
+            for lane, act in zip(lanes[s], actions[s]):
+                if act == 'c':
+                    add_seq(s, lane[1], r-1)
+                lane[0] = next_code(lane[0], act, r, ace_high[s])
+                if act == 's':
+                    lane[1] = r
+            # Keep the same lane order as the search state
+            lanes[s].sort(key=lambda lane: lane[0])
+        if r < N_RANKS:
+            for suits in set_decompositions(copies)[usage][1]:
+                add_group([r * N_SUITS + s for s in suits])
+    for s in range(N_SUITS):
+        for lane in lanes[s]:
+            if lane[0] > 0:
+                add_seq(s, lane[1], ACE_HIGH)
+    return x
+
+def program_play(card_mat, card_min, x):
+    '''Returns how many of each card a solution uses beyond card_min (the
+    optional cards played) as a tuple.'''
+    used = np.asarray(card_mat.T.dot(np.asarray(x, dtype=int))).ravel()
+    return tuple(int(n) for n in used - np.asarray(card_min, dtype=int))
+
+def program_score(card_mat, x):
+    '''Returns (cards used, groups used) for a solution of the grouping
+    program.'''
+    if x is None:
+        return None
+    x = np.asarray(x, dtype=int)
+    return int(card_mat.T.dot(x).sum()), int(x.sum())
@@ -0,0 +1,218 @@
+'''Serves the solver over a Unix socket or a localhost TCP port so frontends
+and bots can solve positions without starting a new process each time.
+
+Clients send one JSON request per line and get one JSON response per line,
+in order.  Each request has an `op`:
+  solve      solve `table` + `hand` (the hand cards are optional)
+  new        start a game session from `table` and `hand`
+  add        add `table` and/or `hand` cards to a session
+  remove     remove `table` and/or `hand` cards from a session
+  play       move `cards` from a session's hand to its table
+  play_hand  solve a session's table + hand
+  close      end a session
+  stats      count the requests answered, open sessions and cache hits
+Session requests give the `session` id returned by `new`.  Solutions are
+given like `machiavelli batch` (`groups`, `play` and `hand`) and session
+requests return the session's `table` and `hand`.  Bad requests get an
+`error`.  An `id` field is copied to the response.
+
+Solves run in a pool of worker processes that keep their solvers (and
+SciPy or CVXPY) loaded between requests, while one asyncio loop handles every
+connection and session.
+'''
+
+import asyncio
+import itertools
+import json
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor
+
+from .cards import DEFAULT_DECK, Cards, ParseError
+
+
+DEFAULT_PORT = 5252
+OPS = ('solve', 'new', 'add', 'remove', 'play', 'play_hand', 'close',
+       'stats')
+
+
+class Server:
+    '''Holds the worker pool, sessions and cache of a running server.'''
+    def __init__(self, workers=None, backend='milp', cache=None,
+                 deck=DEFAULT_DECK):
+        self.workers = workers or os.cpu_count() or 1
+        self.deck = deck
+        self.options = dict(backend=backend, deck=deck)
+        self.cache = cache
+        self.sessions = {}
+        self.requests = 0
+        self._session_ids = itertools.count(1)
+        self._pool = None
+
+    def start(self):
+        '''Starts the worker processes and solves a small position in each so
+        the first requests don't wait for imports.'''
+        from .solver import _init_worker, _solve_task
+        self._pool = ProcessPoolExecutor(self.workers,
+                                         initializer=_init_worker,
+                                         initargs=(self.options,))
+        warmup = bytes(Cards('1s,2s,3s'))
+        for future in [self._pool.submit(_solve_task, warmup, bytes(Cards()))
+                       for _ in range(self.workers)]:
+            future.result()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    async def solve(self, table, hand):
+        '''Solves table + hand in a worker and returns a `Solution` or
+        None.'''
+        from .solver import Solution, _solve_task
+        cards = table + hand
+        self.deck.check(cards)
+        cached = self.cache is not None and not cards.jokers
+        if cached:
+            groups = self.cache.get(cards, hand)
+            if groups is not None:
+                return Solution.from_groups(groups, cards, hand)
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            self._pool, _solve_task, bytes(cards), bytes(hand))
+        if result is None:
+            return None
+        group_ids, joker_cards = result
+        sol = Solution(group_ids, cards, hand, Cards.from_bytes(joker_cards))
+        if cached:
+            self.cache.put(cards, hand, sol)
+        return sol
+
+    def stats(self):
+        '''Returns the number of requests handled (including this one), open
+        sessions and workers, and the cache hits and misses.'''
+        stats = dict(requests=self.requests, sessions=len(self.sessions),
+                     workers=self.workers)
+        if self.cache is not None:
+            info = self.cache.info()
+            stats.update(cache_hits=info.hits, cache_misses=info.misses,
+                         cache_size=info.currsize)
+        return stats
+
+    def session(self, request):
+        session_id = request.get('session')
+        if session_id not in self.sessions:
+            raise ValueError(f'unknown session: {session_id}')
+        return session_id, self.sessions[session_id]
+
+    async def handle(self, request):
+        '''Returns the response to a request.'''
+        from .solver import Position
+        self.requests += 1
+        op = request.get('op')
+        if op not in OPS:
+            raise ValueError(f'unknown op: {op}')
+        if op == 'stats':
+            return self.stats()
+        table = Cards(request.get('table') or '')
+        hand = Cards(request.get('hand') or '')
+        if op == 'solve':
+            return solution_response(await self.solve(table, hand))
+        if op == 'new':
+            session_id = str(next(self._session_ids))
+            self.sessions[session_id] = position = Position(table, hand)
+            return session_response(session_id, position)
+        session_id, position = self.session(request)
+        if op == 'add':
+            position.add(table=table, hand=hand)
+        elif op == 'remove':
+            position.remove(table=table, hand=hand)
+        elif op == 'play':
+            cards = Cards(request.get('cards') or '')
+            if not cards <= position.hand:
+                raise ValueError(f'cards not in hand: {cards - position.hand}')
+            position.play(cards)
+        elif op == 'play_hand':
+            response = solution_response(
+                await self.solve(position.table, position.hand))
+            response['session'] = session_id
+            return response
+        elif op == 'close':
+            del self.sessions[session_id]
+            return dict(session=session_id, closed=True)
+        return session_response(session_id, position)
+
+    async def serve_client(self, reader, writer):
+        '''Answers the requests of one connection in order.'''
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                request = None
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError('request must be a JSON object')
+                    response = await self.handle(request)
+                except (ValueError, TypeError, ParseError) as e:
+                    response = dict(error=str(e))
+                if isinstance(request, dict) and 'id' in request:
+                    response['id'] = request['id']
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def run(self, host='127.0.0.1', port=DEFAULT_PORT, path=None,
+                  ready=None):
+        '''Serves on the Unix socket at `path` or else on host:port until
+        cancelled or sent SIGTERM.  `ready` is called with the listening
+        address.'''
+        if path is not None:
+            server = await asyncio.start_unix_server(self.serve_client, path)
+        else:
+            server = await asyncio.start_server(self.serve_client, host, port)
+        if ready is not None:
+            ready(path or '{}:{}'.format(*server.sockets[0].getsockname()))
+        stop = asyncio.Event()
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM,
+                                                          stop.set)
+        except (NotImplementedError, AttributeError):
+            pass  # No signal handlers on Windows
+        async with server:
+            await stop.wait()
+
+def solution_response(sol):
+    '''Returns the JSON form of a solution of table + hand.'''
+    if sol is None:
+        return dict(groups=None)
+    return dict(groups=sol.labels(),
+                play=str(sol.played), hand=str(sol.remaining))
+
+def session_response(session_id, position):
+    return dict(session=session_id, table=str(position.table),
+                hand=str(position.hand))
+
+def serve(host='127.0.0.1', port=DEFAULT_PORT, path=None, workers=None,
+          backend='milp', cache_file=None, ready=None, deck=DEFAULT_DECK):
+    '''Runs a server until interrupted.'''
+    from .cache import SolutionCache
+    cache = SolutionCache(path=cache_file) if cache_file else None
+    server = Server(workers=workers, backend=backend, cache=cache, deck=deck)
+    server.start()
+    try:
+        asyncio.run(server.run(host, port, path, ready=ready))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if cache is not None:
+            cache.close()
+        if path is not None and os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,164 @@
+'''Plays automated games of Machiavelli to measure solver speed and compare
+playing policies.
+
+Games are dealt from two (or up to four) shuffled decks, optionally with
+jokers, with a seeded random number generator so every game can be replayed
+exactly.  On each turn the player's policy chooses cards to play from the hand.
+If it plays nothing, the player draws a card.  A player wins by emptying their
+hand.  The game is a draw if the deck runs out and every player then passes in
+turn.
+
+A policy is a function `policy(solver, table, hand)` that returns the Cards
+to play (possibly none).  The cards on the table must still form valid
+groups after playing.  Policies must be defined at module level so they can
+be sent to worker processes.
+'''
+
+import random
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .cards import CARDS, JOKER, Deck, Cards
+
+
+def best_play(solver, table, hand):
+    '''Plays as many cards as possible (the solver's best play).'''
+    sol = solver.play_hand(table, hand)
+    if not sol:
+        return Cards()
+    return sol.played
+
+def never_play(solver, table, hand):
+    '''Always draws (a baseline).'''
+    return Cards()
+
+POLICIES = {
+    'best': best_play,
+    'never': never_play,
+}
+
+
+def play_game(seed, policies, hand_size=13, backend='milp', decks=2,
+              jokers=0, max_turns=1000, check_plays=False):
+    '''Plays one game with a player for each policy and returns a dict of:
+      winner: index of the winning player or None for a draw
+      turns: the number of turns played
+      latencies: the seconds taken by each policy call
+      seconds: the time taken by the game
+    '''
+    from .solver import Solver
+
+    start = time.perf_counter()
+    rng = random.Random(seed)
+    deck = CARDS * decks + [JOKER] * jokers
+    rng.shuffle(deck)
+    hands = []
+    for _ in policies:
+        hands.append(Cards(deck[:hand_size]))
+        del deck[:hand_size]
+    table = Cards()
+    solvers = [Solver(quiet=True, backend=backend, deck=Deck(decks, jokers))
+               for _ in policies]
+    checker = Solver(quiet=True, backend=backend,
+                     deck=Deck(decks, jokers)) if check_plays else None
+
+    winner = None
+    latencies = []
+    passes = 0
+    turn = 0
+    while turn < max_turns:
+        player = turn % len(policies)
+        turn += 1
+        hand = hands[player]
+        t = time.perf_counter()
+        play = Cards(policies[player](solvers[player], table, hand))
+        latencies.append(time.perf_counter() - t)
+        if play:
+            if not play <= hand:
+                raise ValueError(f'player {player} played cards not in hand: '
+                                 f'{play - hand}')
+            if checker is not None and checker.find_solution(
+                    table + play) is None:
+                raise ValueError(f'player {player} made an invalid play: '
+                                 f'{play}')
+            hands[player] = hand - play
+            table += play
+            passes = 0
+            if not hands[player]:
+                winner = player
+                break
+        elif deck:
+            hands[player] = hand + Cards(deck[-1:])
+            del deck[-1:]
+        else:
+            passes += 1
+            if passes >= len(policies):
+                break  # No one can play or draw
+    return dict(winner=winner, turns=turn, latencies=latencies,
+                seconds=time.perf_counter() - start)
+
+def _play_game_args(args):
+    seed, policies, kwargs = args
+    return play_game(seed, policies, **kwargs)
+
+def simulate(games, policies, seed=0, workers=1, **kwargs):
+    '''Plays games with seeds seed, seed+1, ... (in parallel if workers > 1)
+    and returns a summary of the results (see `summarize`).
+
+    Extra arguments are passed to `play_game`.'''
+    policies = [POLICIES.get(p, p) for p in policies]
+    args = [(seed + i, policies, kwargs) for i in range(games)]
+    start = time.perf_counter()
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(_play_game_args, args))
+    else:
+        results = [_play_game_args(a) for a in args]
+    return summarize(results, len(policies), time.perf_counter() - start)
+
+def summarize(results, n_players, seconds):
+    '''Returns the win counts, speed and turn latency statistics of games.'''
+    latencies = sorted(l for r in results for l in r['latencies'])
+    def percentile(p):
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies)-1, int(p/100 * len(latencies)))]
+    wins = [0] * n_players
+    for r in results:
+        if r['winner'] is not None:
+            wins[r['winner']] += 1
+    return dict(
+        games=len(results),
+        seconds=seconds,
+        games_per_second=len(results) / seconds if seconds else 0.0,
+        wins=wins,
+        draws=sum(r['winner'] is None for r in results),
+        mean_turns=statistics.mean(r['turns'] for r in results)
+                   if results else 0.0,
+        turns_per_second=len(latencies) / seconds if seconds else 0.0,
+        latency=dict(
+            mean=statistics.mean(latencies) if latencies else 0.0,
+            p50=percentile(50),
+            p90=percentile(90),
+            p99=percentile(99),
+            max=latencies[-1] if latencies else 0.0,
+        ),
+    )
+
+def format_summary(summary, policy_names):
+    '''Returns a printable report of `simulate` results.'''
+    lat = summary['latency']
+    lines = [
+        f"games: {summary['games']} in {summary['seconds']:.2f} s "
+        f"({summary['games_per_second']:.2f} games/s, "
+        f"{summary['turns_per_second']:.1f} turns/s)",
+        f"mean turns: {summary['mean_turns']:.1f}",
+        f"turn latency (ms): mean {lat['mean']*1000:.1f}  "
+        f"p50 {lat['p50']*1000:.1f}  p90 {lat['p90']*1000:.1f}  "
+        f"p99 {lat['p99']*1000:.1f}  max {lat['max']*1000:.1f}",
+    ]
+    for i, (name, wins) in enumerate(zip(policy_names, summary['wins'])):
+        lines.append(f'player {i+1} ({name}): {wins} wins')
+    lines.append(f"draws: {summary['draws']}")
+    return '\n'.join(lines)
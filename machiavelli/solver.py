@@ -1,126 +1,491 @@
 import sys
 import os
+import collections
+import heapq
 import itertools
-from collections import defaultdict, Counter
+import math
+import multiprocessing
+import multiprocessing.connection
 import re
+import threading
+import time
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 import numpy as np
-import cvxpy as cp
+import scipy.sparse as sp
+import scipy.sparse.csgraph as csgraph
 
+from .cards import (
+    NUMBERS, SUITS, CARDS, CARD_IDX, JOKER, MAX_COPIES, DEFAULT_DECK,
+    BACKENDS, Cards, backend_error, sort_key, sort_key_k, sorted_cards,
+    ParseError, parse_cards, input_cards
+)
+from .native import branch_and_bound, program_play, program_score
 
-NUMBERS = '123456789tjqk'  # Allowed alternate inputs: a->1, 0->t, 10->t, emoji
-SUITS = 'scdh'
-CARDS = [
-    n+s
-    for n, s in itertools.product(NUMBERS, SUITS)
-]
+
+def group_catalog():
+    '''Returns every valid set and sequence that can be made from the cards in
+    `CARDS` (in the order they are displayed) and a sparse incidence matrix
+    of groups by cards.'''
+    groups = []
+    for n in NUMBERS:
+        for size in (4, 3):
+            for suits in itertools.combinations(SUITS, size):
+                groups.append([n+s for s in suits])
+    ranks = NUMBERS + NUMBERS[0:1]  # Aces can be low or high
+    for s in SUITS:
+        for l in reversed(range(3, len(NUMBERS)+1)):
+            # A sequence of every rank is the same cards either way
+            starts = 1 if l == len(NUMBERS) else len(ranks)-l+1
+            for j in range(starts):
+                groups.append([n+s for n in ranks[j:j+l]])
+    groups.sort(key=lambda group: sort_key(','.join(sorted_cards(group))))
+    rows = [i for i, group in enumerate(groups) for _ in group]
+    cols = [CARD_IDX[card] for group in groups for card in group]
+    card_mat = sp.csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)),
+                             shape=(len(groups), len(CARDS)))
+    return groups, card_mat
+
+GROUPS, GROUP_MAT = group_catalog()
+GROUP_SIZES = np.diff(GROUP_MAT.indptr)
+GROUP_CARDS = [Cards(group) for group in GROUPS]
+GROUP_IDX = {group: i for i, group in enumerate(GROUP_CARDS)}
+# The groups that contain each card
+CARD_GROUPS = np.split(GROUP_MAT.tocsc().indices,
+                       GROUP_MAT.tocsc().indptr[1:-1])
+# The indices in `CARDS` of the cards of each group
+GROUP_MEMBERS = np.split(GROUP_MAT.indices, GROUP_MAT.indptr[1:-1])
+
+
+# Solvers raced by the portfolio backend: the native search, SciPy's MILP
+# solver and CVXPY's MIP solvers (the ones that are installed)
+PORTFOLIO = ('native', 'milp', 'HIGHS', 'SCIPY', 'GLPK_MI', 'CBC', 'SCIP')
+# Smaller programs are solved by the native search without racing because
+# starting the processes would take longer
+PORTFOLIO_MIN_GROUPS = 64
+# Options that make each CVXPY solver prove optimality exactly and stop at a
+# time limit (in seconds)
+EXACT_OPTIONS = {
+    'HIGHS': lambda limit: dict(mip_rel_gap=0, **(
+        {} if limit is None else dict(time_limit=limit))),
+    'SCIPY': lambda limit: dict(scipy_options=dict(mip_rel_gap=0, **(
+        {} if limit is None else dict(time_limit=limit)))),
+}
+PART_MEMO_SIZE = 1024  # Solutions of independent parts kept by each Solver
+COVER_MAX_NODES = 5000  # Search nodes tried by `cover_cards` before giving up
+# Search nodes tried by `cover_cards` even if the deadline has passed (a
+# grouping found late is still much faster than solving without one)
+COVER_MIN_NODES = 256
+
+# How many hand cards could be played after a draw (see `Solver.lookahead`)
+DrawOutcome = collections.namedtuple('DrawOutcome',
+                                     'draw probability playable')
+
+
+class Position:
+    '''The cards on the table and in hand along with the groups that can be
+    made from them (`group_max`, like `groups_available()`).
+
+    Adding and removing cards only updates the groups containing the cards
+    that changed so replaying many small moves is cheap.  Solve a position
+    with `Solver.solve(position)` (the hand cards are optional).
+    '''
+    def __init__(self, table=(), hand=()):
+        self.table = Cards(table)
+        self.hand = Cards(hand)
+        self.counts = self.cards.counts.astype(int)
+        # The number of cards of each group with fewer than 1, 2, ... copies
+        self._short = np.stack([
+            GROUP_MAT.dot((self.counts < n).astype(np.int8))
+            for n in range(1, MAX_COPIES+1)
+        ])
+
+    @property
+    def cards(self):
+        return self.table + self.hand
+
+    @property
+    def jokers(self):
+        return self.table.jokers + self.hand.jokers
+
+    @property
+    def group_max(self):
+        '''The number of copies of each group in `GROUPS` that can be made.'''
+        if self.jokers:
+            return groups_available(self.counts, self.jokers)
+        return (self._short == 0).sum(axis=0)
+
+    def groups_with(self, card):
+        '''Returns the indices in `GROUPS` of the groups that can be made
+        with the card.'''
+        groups = CARD_GROUPS[CARD_IDX[card]]
+        if self.jokers:
+            return groups[self.group_max[groups] > 0]
+        return groups[(self._short[:, groups] == 0).any(axis=0)]
+
+    def add(self, table=(), hand=()):
+        '''Adds cards to the table and/or hand.'''
+        self.table += table
+        self.hand += hand
+        self._update()
+
+    def remove(self, table=(), hand=()):
+        '''Removes cards from the table and/or hand (ignoring cards that
+        aren't there).'''
+        self.table -= table
+        self.hand -= hand
+        self._update()
+
+    def play(self, cards):
+        '''Moves cards from the hand to the table.'''
+        self.remove(hand=cards)
+        self.add(table=cards)
+
+    def _update(self):
+        counts = self.cards.counts
+        for c in np.flatnonzero(counts != self.counts):
+            old, new = int(self.counts[c]), int(counts[c])
+            for k, n in enumerate(range(1, MAX_COPIES+1)):
+                self._short[k, CARD_GROUPS[c]] += (new < n) - (old < n)
+            self.counts[c] = new
+
+    def copy(self):
+        position = Position.__new__(Position)
+        position.table = self.table
+        position.hand = self.hand
+        position.counts = self.counts.copy()
+        position._short = self._short.copy()
+        return position
+
+    def __repr__(self):
+        return f"Position('{self.table}', '{self.hand}')"
+
+
+class Solution:
+    '''A grouping found by `Solver.solve`, stored as the indices in `GROUPS`
+    of its groups (repeated for groups used twice, in display order).
+
+    It acts like the list of groups (Cards) it describes, but the groups, the
+    cards `used`, the `played` cards and the `remaining` hand are only made
+    when first used so solving many positions doesn't pay for them.
+    `card_indices` gives each group as an array of indices in `CARDS`.
+
+    `joker_cards` are the cards that jokers stand in for.  They are taken
+    from the first groups that contain them, which then hold a joker in
+    their place (see `labels`).
+    '''
+    __slots__ = ('group_ids', 'cards', 'optional_cards', 'joker_cards',
+                 '_groups', '_used', '_labels')
+
+    def __init__(self, group_ids, cards, optional_cards=(), joker_cards=()):
+        self.group_ids = np.asarray(group_ids, dtype=int)
+        self.cards = Cards(cards)
+        self.optional_cards = Cards(optional_cards)
+        self.joker_cards = Cards(joker_cards)
+        self._groups = None
+        self._used = None
+        self._labels = None
+
+    @classmethod
+    def from_groups(cls, groups, cards, optional_cards=()):
+        '''Makes a Solution from a list of groups (Cards or card names).'''
+        return cls(sorted(GROUP_IDX[Cards(group)] for group in groups),
+                   cards, optional_cards)
+
+    @property
+    def groups(self):
+        if self._groups is None:
+            if not self.joker_cards:
+                self._groups = [GROUP_CARDS[i] for i in self.group_ids]
+            else:
+                self._groups = [Cards(label.split(','))
+                                for label in self.labels()]
+        return self._groups
+
+    def labels(self):
+        '''Returns each group as a string of its cards in display order,
+        with 'jk' for the cards that jokers stand in for.'''
+        if self._labels is None:
+            if not self.joker_cards:
+                self._labels = [str(group) for group in self.groups]
+            else:
+                subs = self.joker_cards.counts.astype(int)
+                self._labels = []
+                for i in self.group_ids:
+                    names = []
+                    for card in str(GROUP_CARDS[i]).split(','):
+                        if subs[CARD_IDX[card]]:
+                            subs[CARD_IDX[card]] -= 1
+                            card = JOKER
+                        names.append(card)
+                    self._labels.append(','.join(names))
+        return self._labels
+
+    @property
+    def card_indices(self):
+        indptr, indices = GROUP_MAT.indptr, GROUP_MAT.indices
+        return [indices[indptr[i]:indptr[i+1]] for i in self.group_ids]
+
+    @property
+    def n_used(self):
+        '''The number of cards used.'''
+        return int(GROUP_SIZES[self.group_ids].sum())
+
+    @property
+    def used(self):
+        '''The cards in the groups.'''
+        if self._used is None:
+            copies = np.bincount(self.group_ids, minlength=len(GROUPS))
+            self._used = Cards.from_counts(
+                GROUP_MAT.T.dot(copies) - self.joker_cards.counts,
+                jokers=len(self.joker_cards))
+        return self._used
+
+    @property
+    def remaining(self):
+        '''The cards left over (in hand).'''
+        return self.cards - self.used
+
+    @property
+    def played(self):
+        '''The optional cards (from the hand) that are used.'''
+        return self.optional_cards - self.remaining
+
+    def __len__(self):
+        return len(self.group_ids)
+
+    def __iter__(self):
+        return iter(self.groups)
+
+    def __getitem__(self, i):
+        return self.groups[i]
+
+    def __eq__(self, other):
+        if isinstance(other, Solution):
+            return (np.array_equal(self.group_ids, other.group_ids)
+                    and self.joker_cards == other.joker_cards)
+        if isinstance(other, (list, tuple)):
+            return self.groups == [Cards(group) for group in other]
+        return NotImplemented
+
+    __hash__ = None
+
+    def __str__(self):
+        return ' '.join(f'({label})' for label in self.labels())
+
+    def __repr__(self):
+        return f"Solution('{self}')"
 
 
 class Solver:
-    def __init__(self, quiet=False, pretty=True, color=True, emoji=True):
+    def __init__(self, quiet=False, pretty=True, color=True, emoji=True,
+                 backend='milp', cross_check=False, persistent=False,
+                 workers=1, cache=None, hooks=(), mip_solver=None,
+                 portfolio=None, lp_first=False, deck=DEFAULT_DECK):
+        '''The default 'milp' backend passes the integer program to SciPy's
+        MILP solver (HiGHS) as sparse matrices.  Set `backend='native'` to use
+        the built-in branch-and-bound search or `backend='cvxpy'` to model it
+        with CVXPY (an optional dependency).  With `cross_check=True`, every
+        problem is also solved with the native backend (or with milp if the
+        backend is native) and any difference is reported as an error.
+
+        With `persistent=True`, the CVXPY backend builds one problem over
+        every possible group (`GROUPS`) the first time it is used
+        and only updates its parameters on later calls.  Otherwise, cards
+        that share no possible group are solved as separate problems, using
+        up to `workers` threads.
+
+        `mip_solver` names the CVXPY solver to use (HiGHS by default if it
+        is installed).  The 'portfolio' backend races the solvers in
+        `portfolio` (default `PORTFOLIO`) in separate processes on each
+        problem and keeps the first proven-optimal result (see
+        `solve_program_portfolio`).
+
+        With `lp_first=True`, the LP relaxation of each problem is solved
+        first and its solution is used directly if it is integral.
+        Otherwise its bound is used to stop early (see `solve_relaxation`).
+
+        `deck` is the `Deck` played with: the copies of each card (1 to
+        `MAX_COPIES`) and the number of jokers.  Positions with jokers are
+        solved by `find_solution_jokers`.
+
+        If a `SolutionCache` is given as `cache`, solutions are looked up there
+        first and stored there after solving.
+
+        After each solve, `self.stats` holds a record of the solve (see
+        `solve`) and each function in `hooks` is called with it.  Set the
+        environment variable MACHIAVELLI_PROFILE to profile each solve (see
+        `profiled`).'''
+        if backend not in BACKENDS:
+            raise ValueError(f'unknown backend: {backend}')
+        if backend_error(backend):
+            raise ImportError(backend_error(backend))
         self.quiet = quiet
         self.pretty = pretty
         self.color = color
         self.emoji = emoji
+        self.backend = backend
+        self.cross_check = cross_check
+        self.persistent = persistent
+        self.workers = workers
+        self.cache = cache
+        self.mip_solver = mip_solver
+        self.portfolio = portfolio
+        self.lp_first = lp_first
+        self.deck = deck
+        # How often `solve_relaxation` answered the problem or proved the
+        # starting solution optimal
+        self.relaxations = collections.Counter(solved=0, integral=0, bound=0)
+        # Wins of each portfolio solver by program shape (see `program_shape`)
+        self.portfolio_wins = collections.defaultdict(collections.Counter)
+        self._model = None
+        self._parts = collections.OrderedDict()
+        self._last_turn = None
+        self._lookahead_solver = None
+        # How often `no_play_solution` was tried and answered the solve
+        self.prechecks = collections.Counter(checked=0, hits=0)
+        self.hooks = list(hooks)
+        self.timings = {}
+        self.stats = {}
+        self._stats_lock = threading.Lock()
+
+    def solve(self, cards, optional_cards=(), incumbent=None,
+              time_limit=None, top_k=None):
+        '''Finds and prints the grouping of cards that uses the most cards
+        (and then the fewest groups), using every card not in optional_cards.
+        Returns a `Solution` (which acts as a list of groups) or None if
+        there is none.  Nothing is formatted if the solver is quiet.
+
+        `incumbent` may be a known valid grouping (a list of groups) to warm
+        start the solver with, such as the previous turn's solution.
 
-    def solve(self, cards, optional_cards=()):
+        `cards` may also be a `Position`, which gives the optional cards (its
+        hand) and the groups that can be made.
+
+        With a `time_limit` (in seconds), a greedy grouping is found first and
+        improved by the exact solver until the time runs out.  The best
+        grouping found is returned and `self.stats['optimal']` tells if it
+        is known to be the best.
+
+        With `top_k`, returns a list of up to top_k solutions that each play a
+        different set of optional cards, best first (see `find_solutions`).
+        The cache, incumbent and time limit aren't used then.
+
+        Afterwards, `self.stats` is a dict with the `backend`, the `status`
+        ('optimal', 'best-so-far', 'cached', 'no-play' or 'failed'),
+        `optimal`, the number of `cards`, `optional_cards`, `cards_used` and
+        `groups_used`, the number of `possible_groups`, the rows of the
+        integer program (`program_groups`), the independent `parts` and how
+        many were solved (`parts_solved`), the `solver` name, the solver
+        `iterations` (branch-and-bound nodes for the native and milp
+        backends), the number of `timeouts`, the number of problems answered
+        by the LP relaxation (`relaxed`), `seconds` and `timings`, the
+        seconds spent in each phase.'''
+        start = time.perf_counter()
+        deadline = (None if time_limit is None
+                    else time.perf_counter() + time_limit)
+        self.timings = {}
+        self.stats = dict(backend=self.backend, timings=self.timings)
+        group_max = None
+        if isinstance(cards, Position):
+            group_max = cards.group_max
+            cards, optional_cards = cards.cards, cards.hand
         # Count cards
-        cards = list(cards)
-        card_codes = cards_to_codes(cards)
-        optional_cards = list(optional_cards)
-        assert min((Counter(cards)-Counter(optional_cards)).values(),
-                   default=0) >= 0, (
+        cards = Cards(cards)
+        optional_cards = Cards(optional_cards)
+        assert optional_cards <= cards, (
             'optional_cards must be a subset of cards')
-        card_counts = Counter(cards)
-        optional_counts = Counter(optional_cards)
-
-        # Make grid of cards to find sets and sequences
-        seq_arr = np.zeros((len(SUITS), len(NUMBERS+NUMBERS[0:1])), dtype=int)
-        for i, j in card_codes:
-            seq_arr[i, j] += 1
-
-        seq_arr[:, -1] = seq_arr[:, 0]
-        seq_nonzero = (seq_arr > 0).astype(int)
-
-        # Extract sets, sequences, and find disconnected cards
-        find_seq = np.concatenate([
-                seq_nonzero[:, 0:1] + seq_nonzero[:, 1:2],
-                seq_nonzero[:, :-2] + seq_nonzero[:, 1:-1] + seq_nonzero[:, 2:],
-            ], axis=1)
-        alone = find_seq * seq_nonzero[:, :-1] == 1
-        alone[:, 0] &= seq_nonzero[:, -2] == 0
-        find_set = np.sum(seq_nonzero, axis=0)[:-1]
-        alone[:, find_set >= 3] = False
-
-        # Build a list of all possible sequences using the current cards
-        seq_list = []  # Only the max length sequences, no overlap
-        seq_list_full = []
-        for i in range(len(SUITS)):
-            j = 0
-            while j < len(NUMBERS):
-                if find_seq[i, j] >= 3:
-                    jj = j+1
-                    while jj < len(NUMBERS) and find_seq[i, jj] >= 3:
-                        jj += 1
-                    seq = (np.array([np.full(jj-j+2, i), range(j-1, jj+1)]).T
-                           % len(NUMBERS))
-                    seq_list.append(seq[:13])
-                    seq_list_full.append(seq[:13])
-                    for l in reversed(range(3, min(13, len(seq)))):
-                        for ll in range(len(seq)-l+1):
-                            seq_list_full.append(seq[ll:l+ll])
-                    j = jj - 1
-                j += 1
-
-        # Build a list of all possible sets using the current cards
-        set_list = []  # Only the max length sets, no overlap
-        set_list_full = []
-        arange4 = np.arange(4)
-        for j in range(len(NUMBERS)):
-            if find_set[j] < 3:
-                continue
-            group = np.array([
-                    arange4[seq_nonzero[:, j] > 0],
-                    np.full(find_set[j], j)
-                ]).T
-            set_list.append(group)
-            set_list_full.append(group)
-            if len(group) == 4:
-                set_list_full.append([group[0], group[1], group[2]])
-                set_list_full.append([group[1], group[2], group[3]])
-                set_list_full.append([group[0], group[2], group[3]])
-                set_list_full.append([group[0], group[1], group[3]])
-
-        # Map each card to the list of groups it could participate in
-        card_options = defaultdict(list)
-        for seq in itertools.chain(set_list_full, seq_list_full):
-            for i, j in seq:
-                card_options[i, j].append(frozenset((i, j) for i, j in seq))
+
+        with profiled('solve'):
+            # Solve, or find a solution for the same (or suit-permuted)
+            # position
+            sol = None
+            if top_k is not None:
+                sols = self.find_solutions(cards, optional_cards, top_k,
+                                           group_max)
+                sol = sols[0] if sols else None
+            elif self.cache is not None and not cards.jokers:
+                with self.timed('cache'):
+                    groups = self.cache.get(cards, optional_cards)
+                    if groups is not None:
+                        sol = Solution.from_groups(groups, cards,
+                                                   optional_cards)
+                        self.stats['status'] = 'cached'
+            if sol is None and top_k is None:
+                sol = self.find_solution(cards, optional_cards, incumbent,
+                                         group_max, deadline)
+                if (self.cache is not None and not cards.jokers
+                        and not self.stats.get('timeouts')):
+                    with self.timed('cache'):
+                        self.cache.put(cards, optional_cards, sol)
+            with self.timed('format'):
+                if top_k is None:
+                    self.print_solution(sol, cards, optional_cards)
+                else:
+                    for i, other in enumerate(sols):
+                        if i > 0:
+                            self.print()
+                        self.print(f'# Play {i+1} of {len(sols)}')
+                        self.print_solution(other, cards, optional_cards)
+                if sol is not None and self.stats.get('timeouts'):
+                    self.print('(best found in the time limit)')
+
+        optimal = not self.stats.get('timeouts')
+        self.stats.setdefault('status', 'failed' if sol is None
+                              else 'optimal' if optimal else 'best-so-far')
+        self.stats.update(
+            optimal=sol is not None and optimal,
+            cards=len(cards),
+            optional_cards=len(optional_cards),
+            cards_used=0 if sol is None else sol.n_used,
+            groups_used=0 if sol is None else len(sol),
+            seconds=time.perf_counter() - start,
+        )
+        for hook in self.hooks:
+            hook(self.stats)
+        if top_k is not None:
+            return sols
+        return sol
+
+    @contextlib.contextmanager
+    def timed(self, phase):
+        '''Adds the time taken by the block to `self.timings[phase]`.'''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(phase, time.perf_counter() - start)
+
+    def add_time(self, phase, seconds):
+        with self._stats_lock:
+            self.timings[phase] = self.timings.get(phase, 0) + seconds
+
+    def add_stat(self, name, n):
+        '''Adds n to the count `self.stats[name]`.'''
+        with self._stats_lock:
+            self.stats[name] = self.stats.get(name, 0) + n
+
+    def print_solution(self, sol, cards, optional_cards=()):
+        '''Prints a solution of `solve(cards, optional_cards)`.'''
+        if self.quiet:
+            return  # Skip formatting
+        cards = Cards(cards)
+        optional_cards = Cards(optional_cards)
+        if sol is not None and not isinstance(sol, Solution):
+            sol = Solution.from_groups(sol, cards, optional_cards)
 
         def clean_solution(sol):
             '''Make pretty strings to display a solution'''
             if sol is None:
                 return 'no solution', ''
-            selected = sorted((
-                    name
-                    for name, cnt in sol.items()
-                    for _ in range(cnt)
-                ),
-                key=sort_key
-            )
-            remaining_cnt = (
-                Counter(cards)
-                - Counter(c
-                          for name, cnt in sol.items()
-                          for name2 in [name] * cnt
-                          for c in name.replace('_', '').split(','))
-            )
-            hand = ','.join(sorted_cards(remaining_cnt.elements()))
-            using_cnt = Counter(optional_cards) - remaining_cnt
-            hand_use = ','.join(sorted_cards(using_cnt.elements()))
-            out = f"({') ('.join(selected)})"
-            for card in using_cnt.keys():
-                if using_cnt[card] <= 1:
+            remaining = cards - sol.used
+            using = optional_cards - remaining
+            hand = str(remaining)
+            hand_use = str(using)
+            out = f"({') ('.join(sol.labels())})"
+            for card in set(using):
+                if using[card] <= 1:
                     i = out.find(card)
                     if i >= 0:
                         out = f'{out[:i]}[ {card} ]{out[i+2:]}'
@@ -142,14 +507,11 @@ class Solver:
             '''The number of cards used by the solution.'''
             if sol is None:
                 return 0
-            return sum(
-                len(name.split(',')) * cnt
-                for name, cnt in sol.items()
-            )
+            return sol.n_used
 
         def print_sol(sol):
             '''Print the solution.'''
-            extra = len(card_codes)-solution_size(sol)
+            extra = len(cards)-solution_size(sol)
             table, hand = clean_solution(sol)
             if optional_cards:
                 msg = f'--- {extra} left ---'
@@ -167,121 +529,982 @@ class Solver:
                 self.print(f'hand: {hand}')
             self.print(f'table: {table}')
 
+        print_sol(sol)
+
+    def find_solution(self, cards, optional_cards=(), incumbent=None,
+                      group_max=None, deadline=None):
+        '''Returns the best grouping of the cards (using every card not in
+        optional_cards) as a `Solution` without printing or None if there is
+        none.
+
+        `group_max` may be given if already known (see `Position`).  If the
+        `deadline` (a `time.perf_counter()` time) passes, the best grouping
+        found so far is returned and `self.stats['timeouts']` is set.'''
+        cards = Cards(cards)
+        optional_cards = Cards(optional_cards)
+        count_vec = cards.counts
+        optional_vec = optional_cards.counts
+        if group_max is None:
+            with self.timed('groups'):
+                group_max = groups_available(count_vec, cards.jokers)
+        self.add_stat('possible_groups', int(np.count_nonzero(group_max)))
+
         # Check for an empty solution (otherwise causes the solver to fail)
-        if len(seq_list_full) + len(set_list_full) == 0:
+        if not group_max.any():
             # No solutions
-            if cards == optional_cards:  # Set comparison
-                sol = {}
-            else:
-                sol = None
-            print_sol(sol)
-            return sol
+            if cards == optional_cards:
+                return Solution((), cards, optional_cards)
+            return None
 
-        # Encode as an integer program
-        possible_groups = [
-            codes_to_cards(group)
-            for group in itertools.chain(set_list_full, seq_list_full)
-        ]
-        card_idx = {card: i for i, card in enumerate(card_counts)}
-        card_mat = np.zeros((len(possible_groups), len(card_counts)),
-                            dtype=bool)
-        for i, group in enumerate(possible_groups):
-            for card in group:
-                card_mat[i, card_idx[card]] = True
-        card_min = np.zeros(len(card_counts), dtype=int)
-        card_max = np.zeros(len(card_counts), dtype=int)
-        for card in card_counts.keys():
-            max_count = card_counts[card]
-            min_count = max_count - optional_counts[card]
-            card_min[card_idx[card]] = min_count
-            card_max[card_idx[card]] = max_count
-        group_max = np.array([
-            1 + all(card_counts[card] >= 2 for card in group)
-            for group in possible_groups
-        ])
+        if cards.jokers:
+            return self.find_solution_jokers(cards, optional_cards,
+                                             group_max, deadline)
 
-        # Setup CVXPY
-        x = cp.Variable(len(possible_groups), integer=True)
-        constraints = [
-            card_mat.T @ x >= card_min,
-            card_mat.T @ x <= card_max,
-            x <= group_max,
-            x >= 0
-        ]
-        obj = cp.Maximize(sum(card_mat.T @ x) - sum(x) / 1024)
-        problem = cp.Problem(obj, constraints)
+        # Skip the solver if nothing can be played
+        if optional_cards:
+            sol = self.no_play_solution(cards, optional_cards, incumbent,
+                                        group_max, deadline)
+            if sol is not None:
+                return sol
+
+        with self.timed('matrix'):
+            group_ids, card_mat, card_min, card_max, group_max, dead = (
+                encode_program(count_vec, optional_vec, group_max,
+                               self.persistent))
+
+            # Use the incumbent grouping as a starting point if it is valid
+            x_start = None
+            if deadline is not None:
+                with self.timed('greedy'):
+                    # Leave half of the time to improve on it
+                    now = time.perf_counter()
+                    incumbent = greedy_grouping(
+                        cards, optional_cards, incumbent,
+                        now + max(deadline - now, 0) / 2)
+            if incumbent is not None:
+                x_start = incumbent_vector(incumbent, group_ids, card_mat,
+                                           card_min, card_max, group_max)
+        self.add_stat('program_groups', card_mat.shape[0])
+        if dead.any():
+            self.print_err('solver failed: infeasible (no group for '
+                           f'{Cards.from_counts(dead)})', RuntimeError)
+            return None
 
         # Solve
-        cost = problem_solve_suppress_stdout(problem, verbose=False)
+        if self.persistent:
+            self.add_stat('parts', 1)
+            self.add_stat('parts_solved', 1)
+            x_val = self.solve_program(card_mat, card_min, card_max,
+                                       group_max, x_start, deadline)
+        else:
+            x_val = self.solve_components(card_mat, card_min, card_max,
+                                          group_max, x_start, deadline)
+        if x_val is None:
+            return None
+
+        # Verify valid solution
+        with self.timed('verify'):
+            used_vec = card_mat.T.dot(x_val)
+            valid = not (np.any(used_vec > card_max)
+                         or np.any(used_vec < card_min))
+        if not valid:
+            return None
+        used = np.flatnonzero(x_val)
+        return Solution(np.repeat(group_ids[used], x_val[used]), cards,
+                        optional_cards)
+
+    def find_solution_jokers(self, cards, optional_cards, group_max,
+                             deadline=None):
+        '''Returns the best grouping of cards that include jokers (see
+        `find_solution`), solved with SciPy's MILP solver for every backend.
+
+        Rather than adding a group for every way jokers could complete it,
+        the program gets one more variable per card: the number of jokers
+        standing in for that card.  The groups must then use each card's
+        real copies plus its jokers, the jokers stand in for at most as many
+        cards as there are jokers and for at least as many as are on the
+        table.'''
+        from scipy.optimize import Bounds, LinearConstraint, milp
+        self.stats['solver'] = 'milp'
+        with self.timed('matrix'):
+            group_ids, card_mat, card_min, card_max, group_max, dead = (
+                encode_program(cards.counts, optional_cards.counts,
+                               group_max))
+            n_groups, n_cards = card_mat.shape
+            table_jokers = cards.jokers - optional_cards.jokers
+            mat = sp.bmat([[card_mat.T, -sp.identity(n_cards)],
+                           [None, np.ones((1, n_cards))]], format='csr')
+            cost = np.concatenate([-np.diff(card_mat.indptr) + 1/1024,
+                                   np.zeros(n_cards)])
+            upper = np.concatenate([group_max, np.full(n_cards, cards.jokers)])
+        self.add_stat('program_groups', n_groups)
+        if dead.any():
+            self.print_err('solver failed: infeasible (no group for '
+                           f'{Cards.from_counts(dead)})', RuntimeError)
+            return None
+        self.add_stat('parts', 1)
+        self.add_stat('parts_solved', 1)
+        options = dict(mip_rel_gap=0)
+        if deadline is not None:
+            options['time_limit'] = max(deadline - time.perf_counter(), 0.001)
+        with self.timed('solve'):
+            result = milp(cost, integrality=np.ones(len(cost)),
+                          bounds=Bounds(0, upper),
+                          constraints=LinearConstraint(
+                              mat, np.append(card_min, table_jokers),
+                              np.append(card_max, cards.jokers)),
+                          options=options)
+        self.add_stat('iterations', int(getattr(result, 'mip_node_count', 0)
+                                        or 0))
+        if result.x is None:
+            if result.status != 1:
+                self.print_err(f'solver failed: {result.message}',
+                               RuntimeError)
+            return None
+        if result.status != 0:
+            self.add_stat('timeouts', 1)
+        values = np.round(result.x).astype(int)
+        x_val, joker_vec = values[:n_groups], values[n_groups:]
+        used = np.flatnonzero(x_val)
+        return Solution(np.repeat(group_ids[used], x_val[used]), cards,
+                        optional_cards, Cards.from_counts(joker_vec))
+
+    def no_play_solution(self, cards, optional_cards, incumbent, group_max,
+                         deadline=None):
+        '''Returns the solution if a quick check proves that none of the
+        optional cards can be played, otherwise None.
+
+        The check (see `forced_groups`) takes microseconds while building and
+        solving the program takes milliseconds.  If it doesn't find the whole
+        grouping, only the other cards are solved (a smaller program), warm
+        started with the incumbent.  Tries and hits are counted in
+        `self.prechecks`.'''
+        self.prechecks['checked'] += 1
+        optional_vec = optional_cards.counts
+        with self.timed('precheck'):
+            forced = forced_groups(cards.counts - optional_vec, optional_vec,
+                                   group_max)
+        if forced is None:
+            return None
+        group_ids, complete = forced
+        if not complete:
+            table_sol = self.find_solution(cards - optional_cards,
+                                           incumbent=incumbent,
+                                           deadline=deadline)
+            if table_sol is None:
+                return None
+            group_ids = table_sol.group_ids
+        self.prechecks['hits'] += 1
+        if not self.stats.get('timeouts'):
+            self.stats['status'] = 'no-play'
+        return Solution(group_ids, cards, optional_cards)
+
+    def find_solutions(self, cards, optional_cards=(), k=1, group_max=None):
+        '''Returns up to k groupings of the cards as `Solution`s, best first,
+        that each play a different set of optional cards.
+
+        Each one is the best grouping that doesn't play the same optional
+        cards as an earlier one.  The integer program is built once and every
+        play found is excluded with a cut: a constraint on the MILP or CVXPY
+        problem or a rejected result in the native search.'''
+        cards = Cards(cards)
+        optional_cards = Cards(optional_cards)
+        count_vec = cards.counts
+        optional_vec = optional_cards.counts
+        if cards.jokers:
+            self.print_err('top_k is not supported with jokers',
+                           ValueError)
+            return []
+        if group_max is None:
+            with self.timed('groups'):
+                group_max = groups_available(count_vec)
+        self.add_stat('possible_groups', int(np.count_nonzero(group_max)))
+        if not group_max.any():
+            if cards == optional_cards:
+                return [Solution((), cards, optional_cards)]
+            return []
+
+        with self.timed('matrix'):
+            group_ids, card_mat, card_min, card_max, group_max, dead = (
+                encode_program(count_vec, optional_vec, group_max))
+        self.add_stat('program_groups', card_mat.shape[0])
+        if dead.any():
+            self.print_err('solver failed: infeasible (no group for '
+                           f'{Cards.from_counts(dead)})', RuntimeError)
+            return []
+        top_fns = {
+            'cvxpy': self.top_programs_cvxpy,
+            'native': self.top_programs_native,
+            'milp': self.top_programs_milp,
+            # Racing doesn't help with the search over several solutions
+            'portfolio': self.top_programs_milp,
+        }
+        sols = []
+        for x_val in top_fns[self.backend](card_mat, card_min, card_max,
+                                           group_max, k):
+            used = np.flatnonzero(x_val)
+            sols.append(Solution(np.repeat(group_ids[used], x_val[used]),
+                                 cards, optional_cards))
+        return sols
+
+    def solve_components(self, card_mat, card_min, card_max, group_max,
+                         x_start=None, deadline=None):
+        '''Solves each set of cards that share no possible group separately
+        (in parallel if `workers > 1`) and merges the results.
+
+        The solutions of the parts are remembered so parts that are the same
+        as in a recent solve (such as untouched areas of the table) are not
+        solved again.'''
+        start = time.perf_counter()
+        group_parts, card_parts = group_components(card_mat)
+        parts = []
+        x_val = np.zeros(len(group_max), dtype=int)
+        for i in range(group_parts.max()+1):
+            rows = np.flatnonzero(group_parts == i)
+            in_part = card_parts == i
+            part_min = card_min * in_part
+            part_max = card_max * in_part
+            # The available groups only depend on the cards in the part
+            key = part_min.tobytes(), part_max.tobytes()
+            part_val = self._parts.get(key)
+            if part_val is not None:
+                self._parts.move_to_end(key)
+                x_val[rows] = part_val
+                continue
+            part_start = None if x_start is None else x_start[rows]
+            parts.append((rows, key, (card_mat[rows], part_min, part_max,
+                                      group_max[rows], part_start,
+                                      deadline)))
+        self.add_time('matrix', time.perf_counter() - start)
+        self.add_stat('parts', group_parts.max()+1)
+        self.add_stat('parts_solved', len(parts))
+        if self.workers > 1 and len(parts) > 1:
+            with ThreadPoolExecutor(self.workers) as pool:
+                results = list(pool.map(
+                    lambda part: self.solve_program(*part[2]), parts))
+        else:
+            results = [self.solve_program(*args) for _, _, args in parts]
+        for (rows, key, _), part_val in zip(parts, results):
+            if part_val is None:
+                return None
+            x_val[rows] = part_val
+            if self.stats.get('timeouts'):
+                continue  # Not known to be optimal
+            self._parts[key] = part_val
+            if len(self._parts) > PART_MEMO_SIZE:
+                self._parts.popitem(last=False)
+        return x_val
+
+    def solve_program(self, card_mat, card_min, card_max, group_max,
+                      x_start=None, deadline=None):
+        '''Solves the grouping integer program with the configured backend.
+
+        `x_start` is an optional valid solution to start from.  Returns the
+        number of copies of each group to use or None if there is no valid
+        solution.  If the `deadline` passes, returns the best solution found
+        (at least as good as x_start) and counts a timeout in `self.stats`.
+        '''
+        if (deadline is not None and x_start is not None
+                and time.perf_counter() >= deadline):
+            self.add_stat('timeouts', 1)
+            return x_start
+        x_val = upper_bound = None
+        if self.lp_first:
+            x_val, upper_bound = self.solve_relaxation(
+                card_mat, card_min, card_max, group_max, x_start)
+        solve_fns = {
+            'cvxpy': (self.solve_program_persistent if self.persistent
+                      else self.solve_program_cvxpy),
+            'native': self.solve_program_native,
+            'milp': self.solve_program_milp,
+            'portfolio': self.solve_program_portfolio,
+        }
+        if x_val is None:
+            kwargs = {}
+            if self.backend == 'native' and upper_bound is not None:
+                kwargs.update(upper_bound=upper_bound)
+            x_val = solve_fns[self.backend](card_mat, card_min, card_max,
+                                            group_max, x_start, deadline,
+                                            **kwargs)
+        if self.cross_check and deadline is None:
+            other = 'milp' if self.backend == 'native' else 'native'
+            other_val = solve_fns[other](card_mat, card_min, card_max,
+                                         group_max, x_start)
+            score = program_score(card_mat, x_val)
+            other_score = program_score(card_mat, other_val)
+            if score != other_score:
+                self.print_err(
+                    f'backends disagree (cards, groups): {self.backend} '
+                    f'{score} != {other} {other_score}', RuntimeError)
+        return x_val
+
+    def solve_relaxation(self, card_mat, card_min, card_max, group_max,
+                         x_start=None):
+        '''Solves the LP relaxation of the program (with HiGHS) and returns
+        (x_val, upper_bound).
+
+        x_val is the solution if the relaxation's solution is integral and
+        valid or x_start if its score reaches the bound (so it is optimal),
+        otherwise None.  upper_bound is the best score (cards used * 1024 -
+        groups used) any solution could have, or None if the relaxation is
+        infeasible.  The outcomes are counted in `self.relaxations`.'''
+        from scipy.optimize import Bounds, LinearConstraint, milp
+
+        with self.timed('relax'):
+            cost = -np.diff(card_mat.indptr) + 1/1024
+            result = milp(cost, bounds=Bounds(0, group_max),
+                          constraints=LinearConstraint(card_mat.T, card_min,
+                                                       card_max))
+        self.relaxations['solved'] += 1
+        if result.x is None:
+            return None, None
+        upper_bound = math.floor(-result.fun * 1024 + 1e-6)
+        x_val = np.round(result.x).astype(int)
+        if (np.abs(result.x - x_val).max(initial=0) < 1e-6
+                and program_valid(card_mat, card_min, card_max, group_max,
+                                  x_val)):
+            self.relaxations['integral'] += 1
+            self.add_stat('relaxed', 1)
+            self.stats['solver'] = 'lp'
+            return x_val, upper_bound
+        if x_start is not None:
+            cards, groups = program_score(card_mat, x_start)
+            if cards * 1024 - groups >= upper_bound:
+                self.relaxations['bound'] += 1
+                self.add_stat('relaxed', 1)
+                return x_start, upper_bound
+        return None, upper_bound
+
+    def solve_program_cvxpy(self, card_mat, card_min, card_max, group_max,
+                            x_start=None, deadline=None):
+        import cvxpy as cp  # Slow to import so only loaded when needed
+
+        # Setup CVXPY
+        with self.timed('canonicalize'):
+            x = cp.Variable(len(group_max), integer=True)
+            x.value = x_start
+            constraints = [
+                card_mat.T @ x >= card_min,
+                card_mat.T @ x <= card_max,
+                x <= group_max,
+                x >= 0
+            ]
+            obj = cp.Maximize(sum(card_mat.T @ x) - sum(x) / 1024)
+            problem = cp.Problem(obj, constraints)
+
+        # Solve (solvers that support it start from x.value)
+        cost = self.solve_problem(problem, warm_start=x_start is not None,
+                                  deadline=deadline)
+        if deadline is not None and problem.status != 'optimal':
+            x_val = problem_best(card_mat, card_min, card_max, group_max,
+                                 x.value, x_start)
+            if x_val is not None:
+                self.add_stat('timeouts', 1)
+                return x_val
+            # Nothing to fall back on so solve fully
+            cost = self.solve_problem(problem)
         if isinstance(cost, str) or x.value is None:
             self.print_err(f'solver failed: {problem.status} ({cost})',
                            RuntimeError)
         if x.value is None:
-            sol = None
-            print_sol(sol)
-            return sol
-        else:
-            sol = {
-                cards_to_str(group): round(val)
-                for group, val in zip(possible_groups, x.value)
-                if round(val) > 0
-            }
+            return None
+        return np.round(x.value).astype(int)
 
-        # Verify valid solution
-        sol_card_counts = sum((
-                Counter(group_str.split(','))
-                for group_str, cnt in sol.items()
-                for _ in range(cnt)
-            ),
-            start=Counter()
-        )
-        remaining_counts = Counter(card_counts)
-        remaining_counts.subtract(sol_card_counts)
-        used_hand_counts = Counter(optional_counts)
-        used_hand_counts.subtract(remaining_counts)
-        if (any(val < 0 for val in remaining_counts.values())
-                or any(val < 0 for val in used_hand_counts.values())):
-            # Invalid solution
-            sol = None
+    def solve_program_persistent(self, card_mat, card_min, card_max,
+                                 group_max, x_start=None, deadline=None):
+        '''Solves with the CVXPY problem built over the full group catalog,
+        only updating its parameters if it was already built.'''
+        import cvxpy as cp
 
-        # Print and return in a sorted, easy-to-use form
-        print_sol(sol)
-        selected = [
-            name.split(',')
-            for name in sorted((
-                    name
-                    for name, cnt in sol.items()
-                    for _ in range(cnt)
-                ),
-                key=sort_key
+        start = time.perf_counter()
+        if self._model is None:
+            x = cp.Variable(len(group_max), integer=True)
+            params = (
+                cp.Parameter(len(card_min), nonneg=True, name='card_min'),
+                cp.Parameter(len(card_max), nonneg=True, name='card_max'),
+                cp.Parameter(len(group_max), nonneg=True, name='group_max'),
             )
-        ]
-        return selected
+            min_param, max_param, group_param = params
+            constraints = [
+                card_mat.T @ x >= min_param,
+                card_mat.T @ x <= max_param,
+                x <= group_param,
+                x >= 0
+            ]
+            obj = cp.Maximize(sum(card_mat.T @ x) - sum(x) / 1024)
+            self._model = x, params, cp.Problem(obj, constraints)
+        x, params, problem = self._model
+        for param, val in zip(params, (card_min, card_max, group_max)):
+            param.value = val
+        x.value = x_start
+        self.add_time('canonicalize', time.perf_counter() - start)
+
+        # Solve (solvers that support it start from x.value)
+        cost = self.solve_problem(problem, warm_start=x_start is not None,
+                                  deadline=deadline)
+        if deadline is not None and problem.status != 'optimal':
+            x_val = problem_best(card_mat, card_min, card_max, group_max,
+                                 x.value, x_start)
+            if x_val is not None:
+                self.add_stat('timeouts', 1)
+                return x_val
+            # Nothing to fall back on so solve fully
+            cost = self.solve_problem(problem)
+        if isinstance(cost, str) or x.value is None:
+            self.print_err(f'solver failed: {problem.status} ({cost})',
+                           RuntimeError)
+        if x.value is None:
+            return None
+        return np.round(x.value).astype(int)
+
+    def solve_problem(self, problem, deadline=None, **kwargs):
+        '''Solves a CVXPY problem, splitting the time between canonicalization
+        and the solver itself.
+
+        The deadline is only passed on to solvers in `EXACT_OPTIONS`.  They
+        are asked for exactly optimal solutions because their default
+        tolerance (a relative gap of 1e-4) allows a few extra groups on large
+        tables.'''
+        import cvxpy as cp
+
+        start = time.perf_counter()
+        solver = self.mip_solver
+        if solver is None and cp.HIGHS in cp.installed_solvers():
+            solver = cp.HIGHS
+        if solver is not None:
+            kwargs['solver'] = solver
+        if solver in EXACT_OPTIONS:
+            limit = None if deadline is None else max(deadline - start, 0.001)
+            kwargs.update(EXACT_OPTIONS[solver](limit))
+        cost = problem_solve_suppress_stdout(problem, verbose=False, **kwargs)
+        seconds = time.perf_counter() - start
+        compile_time = min(getattr(problem, 'compilation_time', None) or 0,
+                           seconds)
+        self.add_time('canonicalize', compile_time)
+        self.add_time('solve', seconds - compile_time)
+        solver_stats = problem.solver_stats
+        if solver_stats is not None:
+            self.stats['solver'] = solver_stats.solver_name
+            self.add_stat('iterations', max(solver_stats.num_iters or 0, 0))
+        return cost
+
+    def solve_program_native(self, card_mat, card_min, card_max, group_max,
+                             x_start=None, deadline=None, upper_bound=None):
+        search_stats = {}
+        with self.timed('solve'):
+            x_val = branch_and_bound(card_mat, card_min, card_max, group_max,
+                                     incumbent=x_start, stats=search_stats,
+                                     deadline=deadline,
+                                     upper_bound=upper_bound)
+        self.stats['solver'] = 'native'
+        self.add_stat('iterations', search_stats.get('nodes', 0))
+        if not search_stats.get('complete', True):
+            if x_val is None:
+                # Nothing to fall back on so solve fully
+                return self.solve_program_native(card_mat, card_min,
+                                                 card_max, group_max,
+                                                 upper_bound=upper_bound)
+            self.add_stat('timeouts', 1)
+        if x_val is None:
+            self.print_err('solver failed: infeasible (native)', RuntimeError)
+        return x_val
+
+    def solve_program_milp(self, card_mat, card_min, card_max, group_max,
+                           x_start=None, deadline=None):
+        '''Solves with `scipy.optimize.milp` (HiGHS), passing the sparse
+        program directly without a modeling layer.
+
+        HiGHS is asked for exactly optimal solutions (see `solve_problem`).
+        It can't be warm started so x_start is only the fallback when the
+        deadline passes.  If HiGHS found no valid grouping by the deadline
+        and there is no x_start, the program is solved fully.'''
+        from scipy.optimize import Bounds, LinearConstraint, milp
+
+        with self.timed('canonicalize'):
+            # Maximize cards used then minimize groups
+            cost = -np.diff(card_mat.indptr) + 1/1024
+            constraint = LinearConstraint(card_mat.T, card_min, card_max)
+            options = dict(mip_rel_gap=0)
+            if deadline is not None:
+                options.update(time_limit=max(
+                    deadline - time.perf_counter(), 0.001))
+        with self.timed('solve'):
+            result = milp(cost, integrality=np.ones_like(cost),
+                          bounds=Bounds(0, group_max),
+                          constraints=constraint, options=options)
+        self.stats['solver'] = 'milp'
+        self.add_stat('iterations', getattr(result, 'mip_node_count', 0) or 0)
+        if deadline is not None and result.status != 0:
+            x_val = problem_best(card_mat, card_min, card_max, group_max,
+                                 result.x, x_start)
+            if x_val is None:
+                # Nothing to fall back on so solve fully
+                return self.solve_program_milp(card_mat, card_min, card_max,
+                                               group_max)
+            self.add_stat('timeouts', 1)
+            return x_val
+        if result.x is None:
+            self.print_err(f'solver failed: {result.message} (milp)',
+                           RuntimeError)
+            return None
+        return np.round(result.x).astype(int)
+
+    def solve_program_portfolio(self, card_mat, card_min, card_max,
+                                group_max, x_start=None, deadline=None):
+        '''Solves the program with every portfolio solver at once, each in a
+        forked process, and returns the first proven-optimal result.  The
+        other processes are then killed.
+
+        Processes are used (rather than threads) because the CVXPY solvers
+        hold the GIL and print to stdout, and a killed process can't leave a
+        solver running.  If the deadline passes first, the processes are
+        killed and the best result received (or x_start) is returned.  The
+        winning solver is counted in `self.portfolio_wins` under the shape of
+        the program.  If none sent a valid grouping by then and there is no
+        x_start, the program is solved fully with milp.'''
+        if card_mat.shape[0] < PORTFOLIO_MIN_GROUPS:
+            return self.solve_program_native(card_mat, card_min, card_max,
+                                             group_max, x_start, deadline)
+        with self.timed('solve'):
+            entrants = portfolio_entrants(self.portfolio)
+            args = (card_mat, card_min, card_max, group_max, x_start,
+                    deadline)
+            ctx = multiprocessing.get_context(
+                'fork' if 'fork' in multiprocessing.get_all_start_methods()
+                else None)
+            procs = {}
+            for entrant in entrants:
+                recv, send = ctx.Pipe(duplex=False)
+                proc = ctx.Process(target=_portfolio_entrant,
+                                   args=(send, entrant, args), daemon=True)
+                proc.start()
+                send.close()
+                procs[recv] = entrant, proc
+            winner = best = None
+            try:
+                while procs and winner is None:
+                    timeout = (None if deadline is None
+                               else max(deadline - time.perf_counter(), 0))
+                    ready = multiprocessing.connection.wait(list(procs),
+                                                            timeout)
+                    if not ready:
+                        break  # Out of time
+                    for conn in ready:
+                        entrant, proc = procs.pop(conn)
+                        try:
+                            x_val, optimal = conn.recv()
+                        except EOFError:
+                            continue  # The solver crashed
+                        finally:
+                            conn.close()
+                            proc.join()
+                        if x_val is None:
+                            continue
+                        if optimal:
+                            winner, best = entrant, x_val
+                            break
+                        if best is None or (program_score(card_mat, x_val)
+                                            > program_score(card_mat, best)):
+                            best = x_val
+            finally:
+                for conn, (_, proc) in procs.items():
+                    proc.kill()
+                    proc.join()
+                    conn.close()
+        self.stats['solver'] = winner
+        if winner is not None:
+            shape = program_shape(card_mat, card_min, card_max)
+            self.portfolio_wins[shape][winner] += 1
+            return best
+        if best is None:
+            best = x_start
+        if best is None:
+            if deadline is not None:
+                # Nothing to fall back on so solve fully
+                return self.solve_program_milp(card_mat, card_min, card_max,
+                                               group_max)
+            self.print_err('solver failed: no portfolio solver finished',
+                           RuntimeError)
+            return None
+        self.add_stat('timeouts', 1)
+        return best
 
-    def play_hand(self, table, hand=''):
+    def top_programs_cvxpy(self, card_mat, card_min, card_max, group_max, k):
+        '''Yields up to k solutions of the program, best first, that each
+        use different optional cards.
+
+        Each optional copy of a card gets a binary variable (true if at least
+        that many copies are used) and earlier plays are excluded by "no-good"
+        cuts on them.  The cuts are parameters so the problem is only
+        canonicalized once.'''
+        import cvxpy as cp
+
+        with self.timed('canonicalize'):
+            extra = card_max - card_min
+            slot_cards = np.repeat(np.arange(len(extra)), extra)
+            # The copy number of each slot (0 for the first copy of a card)
+            slot_copy = np.arange(len(slot_cards)) - np.repeat(
+                np.cumsum(extra) - extra, extra)
+            if len(slot_cards) == 0:
+                k = 1  # There is only one play
+            x = cp.Variable(len(group_max), integer=True)
+            constraints = [x <= group_max, x >= 0]
+            cut_mat = cut_min = None
+            if len(slot_cards) == 0:
+                constraints.append(card_mat.T @ x == card_min)
+            else:
+                z = cp.Variable(len(slot_cards), boolean=True)
+                slot_mat = sp.csr_matrix(
+                    (np.ones(len(slot_cards)),
+                     (slot_cards, np.arange(len(slot_cards)))),
+                    shape=(len(extra), len(slot_cards)))
+                constraints.append(card_mat.T @ x == card_min + slot_mat @ z)
+                later = np.flatnonzero(slot_copy > 0)
+                if len(later):
+                    constraints.append(z[later - 1] >= z[later])
+                if k > 1:
+                    cut_mat = cp.Parameter((k-1, len(slot_cards)),
+                                           value=np.zeros((k-1,
+                                                           len(slot_cards))))
+                    cut_min = cp.Parameter(k-1, value=np.zeros(k-1))
+                    constraints.append(cut_mat @ z >= cut_min)
+            obj = cp.Maximize(sum(card_mat.T @ x) - sum(x) / 1024)
+            problem = cp.Problem(obj, constraints)
+
+        for i in range(k):
+            cost = self.solve_problem(problem)
+            if x.value is None:
+                if i == 0:
+                    self.print_err(f'solver failed: {problem.status} '
+                                   f'({cost})', RuntimeError)
+                return
+            x_val = np.round(x.value).astype(int)
+            yield x_val
+            if i+1 < k:
+                # Require a different count of some optional card
+                play = np.asarray(program_play(card_mat, card_min, x_val))
+                played = slot_copy < play[slot_cards]
+                cuts = cut_mat.value
+                cuts[i] = np.where(played, -1, 1)
+                cut_mat.value = cuts
+                bounds = cut_min.value
+                bounds[i] = 1 - played.sum()
+                cut_min.value = bounds
+
+    def top_programs_milp(self, card_mat, card_min, card_max, group_max, k):
+        '''Yields up to k solutions of the program, best first, like
+        `top_programs_cvxpy` but with `scipy.optimize.milp`.  Each earlier
+        play adds a cut row to the sparse constraints.'''
+        from scipy.optimize import Bounds, LinearConstraint, milp
+
+        with self.timed('canonicalize'):
+            extra = card_max - card_min
+            slot_cards = np.repeat(np.arange(len(extra)), extra)
+            slot_copy = np.arange(len(slot_cards)) - np.repeat(
+                np.cumsum(extra) - extra, extra)
+            n_groups, n_slots = len(group_max), len(slot_cards)
+            if n_slots == 0:
+                k = 1  # There is only one play
+            # The variables are the group counts then the slots
+            slot_mat = sp.csr_matrix(
+                (np.ones(n_slots), (slot_cards, np.arange(n_slots))),
+                shape=(len(extra), n_slots))
+            constraints = [LinearConstraint(
+                sp.hstack([card_mat.T, -slot_mat]), card_min, card_min)]
+            later = np.flatnonzero(slot_copy > 0)
+            if len(later):
+                order_mat = sp.csr_matrix(
+                    (np.r_[np.ones(len(later)), -np.ones(len(later))],
+                     (np.r_[np.arange(len(later)), np.arange(len(later))],
+                      np.r_[later - 1, later] + n_groups)),
+                    shape=(len(later), n_groups + n_slots))
+                constraints.append(LinearConstraint(order_mat, 0, np.inf))
+            cost = np.r_[-np.diff(card_mat.indptr) + 1/1024, np.zeros(n_slots)]
+            bounds = Bounds(0, np.r_[group_max, np.ones(n_slots)])
+
+        for i in range(k):
+            with self.timed('solve'):
+                result = milp(cost, integrality=np.ones_like(cost),
+                              bounds=bounds, constraints=constraints,
+                              options=dict(mip_rel_gap=0))
+            self.stats['solver'] = 'milp'
+            if result.x is None:
+                if i == 0:
+                    self.print_err(f'solver failed: {result.message} (milp)',
+                                   RuntimeError)
+                return
+            x_val = np.round(result.x[:n_groups]).astype(int)
+            yield x_val
+            if i+1 < k:
+                # Require a different count of some optional card
+                play = np.asarray(program_play(card_mat, card_min, x_val))
+                played = slot_copy < play[slot_cards]
+                cut = np.r_[np.zeros(n_groups), np.where(played, -1, 1)]
+                constraints.append(LinearConstraint(
+                    sp.csr_matrix(cut), 1 - played.sum(), np.inf))
+
+    def top_programs_native(self, card_mat, card_min, card_max, group_max, k):
+        '''Yields up to k solutions of the program, best first, that each
+        use different optional cards.
+
+        The plays not yet found are split into parts by bounds on the card
+        counts (like Murty's ranking method): after a play is taken from a
+        part, the rest of the part is split by the first card whose count
+        differs from the play, with fewer or more copies.  Each part is
+        solved by a plain search and the best part is taken next.'''
+        self.stats['solver'] = 'native'
+
+        def solve_part(lo, hi, need):
+            # Only look for solutions that can be one of the next `need`
+            cutoff = None
+            if len(parts) >= need:
+                cutoff = -heapq.nsmallest(need, parts)[-1][0]
+            search_stats = {}
+            with self.timed('solve'):
+                x_val = branch_and_bound(card_mat, lo, hi, group_max,
+                                         stats=search_stats, cutoff=cutoff)
+            self.add_stat('iterations', search_stats.get('nodes', 0))
+            if x_val is not None:
+                cards, groups = program_score(card_mat, x_val)
+                heapq.heappush(parts, (groups - cards * 1024, next(order),
+                                       x_val, lo, hi))
+
+        parts = []
+        order = itertools.count()  # Ties go to the part solved first
+        solve_part(card_min, card_max, k)
+        if not parts:
+            self.print_err('solver failed: infeasible (native)', RuntimeError)
+            return
+        for i in range(k):
+            if not parts:
+                return
+            _, _, x_val, lo, hi = heapq.heappop(parts)
+            yield x_val
+            if i+1 == k:
+                return
+            used = card_mat.T.dot(x_val)
+            lo, hi = lo.copy(), hi.copy()
+            for c in np.flatnonzero(lo < hi):
+                if used[c] > lo[c]:
+                    fewer = hi.copy()
+                    fewer[c] = used[c] - 1
+                    solve_part(lo.copy(), fewer, k-i-1)
+                if used[c] < hi[c]:
+                    more = lo.copy()
+                    more[c] = used[c] + 1
+                    solve_part(more, hi.copy(), k-i-1)
+                # Later parts use the same number of this card
+                lo[c] = hi[c] = used[c]
+
+    def solve_many(self, positions, workers=None):
+        '''Solves many positions without printing and yields the solutions
+        (or None if there is none) in the same order.
+
+        Each position is a `Position`, a `(cards, optional_cards)` pair or
+        just the cards.  The positions are solved by `workers` processes
+        (default: one per CPU), each keeping its own solver between
+        positions.  Positions are read from the iterable as needed so it may
+        be a stream.  The cache (if any) is used in this process only.
+        Raises ValueError for a position with more copies of a card or more
+        jokers than the deck.
+        '''
+        if workers is None:
+            workers = os.cpu_count() or 1
+        options = dict(backend=self.backend, cross_check=self.cross_check,
+                       persistent=self.persistent, deck=self.deck)
+
+        def tasks():
+            for position in positions:
+                if isinstance(position, Position):
+                    cards, optional_cards = position.cards, position.hand
+                elif isinstance(position, tuple):
+                    cards, optional_cards = map(Cards, position)
+                else:
+                    cards, optional_cards = Cards(position), Cards()
+                if not optional_cards <= cards:
+                    raise ValueError(
+                        'optional_cards must be a subset of cards')
+                self.deck.check(cards)
+                sol = None
+                if self.cache is not None and not cards.jokers:
+                    groups = self.cache.get(cards, optional_cards)
+                    if groups is not None:
+                        sol = Solution.from_groups(groups, cards,
+                                                   optional_cards)
+                yield cards, optional_cards, sol
+
+        def finish(cards, optional_cards, result):
+            if result is None:
+                return None
+            group_ids, joker_cards = result
+            sol = Solution(group_ids, cards, optional_cards,
+                           Cards.from_bytes(joker_cards))
+            if self.cache is not None and not cards.jokers:
+                self.cache.put(cards, optional_cards, sol)
+            return sol
+
+        if workers <= 1:
+            _init_worker(options)
+            for cards, optional_cards, sol in tasks():
+                if sol is None:
+                    sol = finish(cards, optional_cards, _solve_task(
+                        bytes(cards), bytes(optional_cards)))
+                yield sol
+            return
+
+        # Keep a few positions per worker in flight and yield in order
+        with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                 initargs=(options,)) as pool:
+            pending = collections.deque()
+            def next_result():
+                cards, optional_cards, sol, future = pending.popleft()
+                if future is None:
+                    return sol
+                return finish(cards, optional_cards, future.result())
+            for cards, optional_cards, sol in tasks():
+                future = None
+                if sol is None:
+                    future = pool.submit(_solve_task, bytes(cards),
+                                         bytes(optional_cards))
+                pending.append((cards, optional_cards, sol, future))
+                if len(pending) >= workers * 4:
+                    yield next_result()
+            while pending:
+                yield next_result()
+
+    def play_hand(self, table, hand='', time_limit=None):
         '''Convenience method to parse and check inputs and check the table
-        state is solvable before solving table+hand.'''
-        if isinstance(table, str):
-            table = parse_cards(table)
-        if isinstance(hand, str):
-            hand = parse_cards(hand)
-        if isinstance(table, Counter):
-            table = list(table.elements())
-        if isinstance(hand, Counter):
-            hand = list(hand.elements())
-        if max(Counter(table+hand).values(), default=0) > 2:
-            for c, n in Counter(table+hand).most_common(1):
-                self.print_err(f'more than two of card: {c} (x{n})', ValueError)
-        for c in table+hand:
-            if c not in CARDS:
-                raise ValueError(f'invalid card: {c}')
+        state is solvable before solving table+hand.
+
+        Consecutive calls reuse the last turn: the table isn't solved again if
+        it is unchanged or exactly the cards of the last solution, and the
+        table's grouping warm starts the solve of table+hand.
+
+        `table` may also be a `Position`, which gives the hand.  The
+        `time_limit` (in seconds) is shared by both solves (see `solve`).'''
+        start = time.perf_counter()
+        position = None
+        if isinstance(table, Position):
+            position = table
+            table, hand = position.table, position.hand
+        table = Cards(table)
+        hand = Cards(hand)
+        if (table+hand).max_count() > self.deck.copies:
+            counts = (table+hand).counts
+            c, n = CARDS[counts.argmax()], counts.max()
+            self.print_err(f'more than {self.deck.copies} of card: {c} (x{n})',
+                           ValueError)
+        if (table+hand).jokers > self.deck.jokers:
+            self.print_err(f'more than {self.deck.jokers} jokers: '
+                           f'{(table+hand).jokers}', ValueError)
         self.print()
+        table_sol = None
+        if self._last_turn is not None:
+            last_table, last_table_sol, last_sol = self._last_turn
+            if table == last_table:
+                table_sol = last_table_sol
+            elif last_sol and last_sol.used == table:
+                # The best play was made so the table is grouped like this
+                table_sol = last_sol
         if hand:
             self.print('### Before your play ###')
-            self.solve(table)
+            if table_sol is None:
+                table_sol = self.solve(table, time_limit=time_limit)
+            else:
+                self.print_solution(table_sol, table)
             self.print()
         self.print('### Solve ###')
-        return self.solve(table+hand, hand)
+        if position is None:
+            position = Position(table, hand)
+        if time_limit is not None:
+            time_limit = max(time_limit - (time.perf_counter() - start), 0)
+        sol = self.solve(position, incumbent=table_sol, time_limit=time_limit)
+        self._last_turn = table, table_sol, sol
+        return sol
+
+    def lookahead(self, table, hand='', draws=1, unseen=None,
+                  time_limit=None):
+        '''Returns how many hand cards could be played after drawing each
+        possible multiset of `draws` cards as a list of
+        `DrawOutcome(draw, probability, playable)`, most playable first.
+
+        `unseen` are the cards that may be drawn, each copy equally likely
+        (default: the cards of the deck not on the table or in hand).  The
+        expected number of playable cards is the sum of
+        `probability * playable`.  Nothing is printed.
+
+        Every hypothesis updates the same `Position` with the drawn cards.
+        Draws that can't be in any group don't change the best play so they
+        aren't solved.  The others start from the best play without the draw
+        and are solved by a second solver kept for lookaheads, which solves
+        the LP relaxation first (see `lp_first`) and only solves the parts
+        of the table the draw touches again (see `solve_components`).  With
+        CVXPY, it builds one persistent model for every hypothesis (and
+        turn).
+
+        With a `time_limit` (in seconds spent on the draws after the best
+        play without them), the most likely draws are solved first and draws
+        not solved in time have `playable` None.'''
+        start = time.perf_counter()
+        position = None
+        if isinstance(table, Position):
+            position = table.copy()
+            table, hand = position.table, position.hand
+        table = Cards(table)
+        hand = Cards(hand)
+        if position is None:
+            position = Position(table, hand)
+        if unseen is None:
+            unseen = self.deck.cards() - table - hand
+        unseen = Cards(unseen)
+        self.timings = {}
+        self.stats = dict(backend=self.backend, timings=self.timings)
+        if self._lookahead_solver is None:
+            self._lookahead_solver = Solver(
+                quiet=True, backend=self.backend,
+                persistent=self.persistent or self.backend == 'cvxpy',
+                lp_first=True,
+                deck=self.deck)
+        solver = self._lookahead_solver
+        solver.timings, solver.stats = self.timings, self.stats
+
+        base = solver.find_solution(position.cards, position.hand,
+                                    group_max=position.group_max)
+        if base is None:
+            self.print_err('solver failed: the table has no valid grouping',
+                           RuntimeError)
+            return []
+        total = math.comb(len(unseen), draws)
+        deadline = (None if time_limit is None
+                    else time.perf_counter() + time_limit)
+        outcomes = []
+        solved = unsolved = 0
+        hypotheses = sorted(draw_multisets(unseen, draws),
+                            key=lambda hypothesis: -hypothesis[1])
+        for draw, ways in hypotheses:
+            position.add(hand=draw)
+            if not any(card == JOKER or len(position.groups_with(card))
+                       for card in set(draw)):
+                playable = len(base.played)
+            elif deadline is not None and time.perf_counter() > deadline:
+                playable = None
+                unsolved += 1
+            else:
+                sol = solver.find_solution(position.cards, position.hand,
+                                           incumbent=base,
+                                           group_max=position.group_max)
+                playable = len(sol.played)
+                solved += 1
+            position.remove(hand=draw)
+            outcomes.append(DrawOutcome(draw, ways / total, playable))
+        outcomes.sort(key=lambda o: (o.playable is None, -(o.playable or 0)))
+        self.stats.update(
+            hypotheses=len(outcomes),
+            hypotheses_solved=solved,
+            hypotheses_unsolved=unsolved,
+            seconds=time.perf_counter() - start,
+        )
+        return outcomes
 
     def print(self, *args, **kwargs):
         if not self.quiet:
@@ -298,8 +1521,27 @@ class Solver:
             else:
                 print(f'Error: {msg}', file=sys.stderr)
 
+    def print_stats(self, stats):
+        '''A hook (see `hooks`) that prints a summary of the solve stats to
+        stderr.'''
+        timings = ', '.join(f'{phase} {seconds*1000:.1f}'
+                            for phase, seconds in stats['timings'].items())
+        print(f"stats: {stats['backend']} ({stats.get('solver', '-')}) "
+              f"{stats['status']}, {stats['cards']} cards, "
+              f"{stats.get('possible_groups', 0)} possible groups, "
+              f"{stats.get('parts_solved', 0)}/{stats.get('parts', 0)} parts "
+              f"solved, {stats.get('iterations', 0)} iterations, "
+              f"{self.prechecks['hits']}/{self.prechecks['checked']} no-play "
+              f"prechecks hit, "
+              + (f"{self.relaxations['integral']}/"
+                 f"{self.relaxations['solved']} relaxations integral, "
+                 if self.lp_first else '')
+              + f"{stats['seconds']*1000:.1f} ms ({timings})",
+              file=sys.stderr)
+
     def pretty_cards(self, cards_str):
         if self.emoji:
+            cards_str = cards_str.replace(JOKER, '🃏')
             cards_str = cards_str.replace('s', '♠️ ').replace('c', '♣️ ')
             cards_str = cards_str.replace('d', '♦️ ').replace('h', '♥️ ')
         if self.pretty:
@@ -327,116 +1569,438 @@ class Solver:
             cards_str = re.sub(r'\[ ([^[\]]*) \]', mark, cards_str)
         return cards_str
 
+PROFILE_ENV = 'MACHIAVELLI_PROFILE'
+_profile_count = itertools.count(1)
+
+@contextlib.contextmanager
+def profiled(name):
+    '''Profiles the block with cProfile if the environment variable
+    MACHIAVELLI_PROFILE is set.
+
+    If it names a directory, the profile is saved there as
+    `{name}-{pid}-{n}.prof` (open with `python -m pstats`).  Otherwise the
+    slowest functions are printed to stderr.
+    '''
+    target = os.environ.get(PROFILE_ENV)
+    if not target:
+        yield
+        return
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        if os.path.isdir(target):
+            profiler.dump_stats(os.path.join(
+                target, f'{name}-{os.getpid()}-{next(_profile_count)}.prof'))
+        else:
+            stats = pstats.Stats(profiler, stream=sys.stderr)
+            stats.sort_stats('cumulative').print_stats(20)
+
+_worker_solver = None
+
+def _init_worker(options):
+    '''Makes the solver used by `_solve_task` in this process.'''
+    global _worker_solver
+    _worker_solver = Solver(quiet=True, **options)
+
+def _solve_task(cards, optional_cards):
+    '''Solves a position given as bytes and returns the indices in `GROUPS`
+    of the solution and its `joker_cards` as bytes or None if there is
+    none.'''
+    try:
+        sol = _worker_solver.find_solution(Cards.from_bytes(cards),
+                                           Cards.from_bytes(optional_cards))
+    except RuntimeError:
+        return None  # Infeasible or the solver failed
+    if sol is None:
+        return None
+    return sol.group_ids.tolist(), bytes(sol.joker_cards)
+
+def portfolio_entrants(names=None):
+    '''Returns the solvers in `names` (default `PORTFOLIO`) that can be
+    used here.'''
+    names = PORTFOLIO if names is None else names
+    builtin = ('native', 'milp')
+    if all(name in builtin for name in names):
+        return list(names)
+    try:
+        import cvxpy as cp
+    except ImportError:
+        return [name for name in names if name in builtin]
+    installed = cp.installed_solvers()
+    return [name for name in names if name in builtin or name in installed]
+
+def _portfolio_entrant(conn, entrant, args):
+    '''Solves a program with one portfolio solver (in a child process) and
+    sends back the solution and whether it is known to be optimal.'''
+    if entrant in ('native', 'milp'):
+        solver = Solver(quiet=True, backend=entrant)
+    else:
+        solver = Solver(quiet=True, backend='cvxpy', mip_solver=entrant)
+    try:
+        x_val = solver.solve_program(*args)
+    except Exception:
+        x_val = None  # Send no solution rather than crashing the pipe
+    conn.send((x_val, not solver.stats.get('timeouts')))
+    conn.close()
+
+def program_shape(card_mat, card_min, card_max):
+    '''Returns a key for the size of a program, such as 'g64-c32-o8' for up
+    to 64 groups over up to 32 cards, up to 8 of them optional.'''
+    def bucket(n):
+        return 1 << (int(n) - 1).bit_length() if n > 0 else 0
+    groups = card_mat.shape[0]
+    cards = card_max.sum()
+    optional = cards - card_min.sum()
+    return f'g{bucket(groups)}-c{bucket(cards)}-o{bucket(optional)}'
+
+_stdout_lock = threading.Lock()
+_stdout_users = 0
+_stdout_saved = None
+
 def problem_solve_suppress_stdout(problem, **kwargs):
-    '''Suppress diagnostic messages printed by CVXPY C-libraries.'''
-    dup_success = False
-    stdout_cp = None
-    devnull = None
+    '''Suppress diagnostic messages printed by CVXPY C-libraries.
+
+    This may be called from several threads at once.  Stdout is redirected
+    while any call is running and restored when the last one finishes.
+    '''
+    global _stdout_users, _stdout_saved
+    with _stdout_lock:
+        if _stdout_users == 0:
+            stdout_cp = None
+            try:
+                stdout_cp = os.dup(1)
+                with open(os.devnull, 'w') as devnull:
+                    os.dup2(devnull.fileno(), 1)
+                _stdout_saved = stdout_cp
+            except OSError:
+                # Give up and run without stdout suppression
+                if stdout_cp is not None:
+                    os.close(stdout_cp)
+                _stdout_saved = None
+        _stdout_users += 1
     try:
-        stdout_cp = os.dup(1)
-        devnull = open(os.devnull, 'w')
-        os.dup2(devnull.fileno(), 1)
-        dup_success = True
         return problem.solve(**kwargs)
-    except:
-        if dup_success:
-            raise
-        else:
-            # Give up and run without stdout suppression
-            return problem.solve(**kwargs)
     finally:
-        if devnull is not None:
-            devnull.close()
-        if stdout_cp is not None:
-            os.dup2(stdout_cp, 1)
-            os.close(stdout_cp)
-
-def sort_key(s):
-    s = s.lower()
-    s = s.replace('a', '1').replace('q', 'i')
-    s = s.replace('j', 'h').replace('s', 'b').replace('t', 'b')
-    # Sort sequences after sets
-    if ',' in s and not all(ss[:1] == s[:1] for ss in s.split(',')):
-        s = 'z_' + s
-    return s
-
-def sort_key_k(s):
-    return sort_key(s).replace('1', 'l')
-
-def sorted_cards(cards):
-    '''Returns the cards sorted nicely.'''
-    cards = list(cards)
-    if (any('k' in card for card in cards)
-            and not any('2' in card for card in cards)):
-        cards.sort(key=sort_key_k)
+        with _stdout_lock:
+            _stdout_users -= 1
+            if _stdout_users == 0 and _stdout_saved is not None:
+                os.dup2(_stdout_saved, 1)
+                os.close(_stdout_saved)
+                _stdout_saved = None
+
+def encode_program(count_vec, optional_vec, group_max, all_groups=False):
+    '''Returns (group_ids, card_mat, card_min, card_max, group_max, dead)
+    describing the integer program for the given card counts.
+
+    The program's groups are `GROUPS[group_ids]` (every group if
+    `all_groups`, otherwise those that can be made).  `dead` counts the
+    required cards that can't be in any group.'''
+    if all_groups:
+        group_ids = np.arange(len(GROUPS))
+        card_mat = GROUP_MAT
     else:
-        cards.sort(key=sort_key)
-    return cards
+        group_ids = np.flatnonzero(group_max)
+        card_mat = GROUP_MAT[group_ids]
+        group_max = group_max[group_ids]
+    card_min = count_vec - optional_vec
+    card_max = count_vec
 
-def cards_to_codes(cards):
-    '''Converts a list of card names to (suit_index, rank_index) tuples.'''
-    return np.array([
-        (SUITS.index(s), NUMBERS.index(n))
-        for n, s in cards
-    ])
+    # Drop cards that can't be in any group
+    placeable = card_mat.T.dot(group_max) > 0
+    dead = card_min * ~placeable
+    card_max = card_max * placeable
+    return group_ids, card_mat, card_min, card_max, group_max, dead
 
-def codes_to_cards(codes):
-    '''Converts a list of (suit_index, rank_index) tuples to card names.'''
-    return [
-        f'{NUMBERS[j]}{SUITS[i]}'
-        for i, j in codes
-    ]
+def group_components(card_mat):
+    '''Splits the groups into components that share no cards.
 
-def codes_to_str(codes):
-    '''Converts a list of card codes (index tuples) to a sorted,
-    comma-separated, printable string.'''
-    return cards_to_str(codes_to_cards(codes))
+    Returns the component of each group and the component of each card (-1
+    for cards that are in no group).
+    '''
+    card_mat = sp.csr_matrix(card_mat)
+    _, labels = csgraph.connected_components(card_mat.T.dot(card_mat),
+                                             directed=False)
+    first_cards = card_mat.indices[card_mat.indptr[:-1]]
+    parts, group_parts = np.unique(labels[first_cards], return_inverse=True)
+    card_parts = np.full(card_mat.shape[1], -1)
+    for i, label in enumerate(parts):
+        card_parts[labels == label] = i
+    card_parts[np.asarray(card_mat.sum(axis=0)).ravel() == 0] = -1
+    return group_parts, card_parts
 
-def cards_to_str(cards):
-    '''Converts a list of card names to a sorted, comma-separated, printable
-    string.'''
-    return ','.join(sorted_cards(cards))
+def incumbent_vector(groups, group_ids, card_mat, card_min, card_max,
+                     group_max):
+    '''Converts a list of groups to a solution vector over group_ids or
+    returns None if it is not a valid solution of the program.'''
+    pos = {g: i for i, g in enumerate(group_ids)}
+    x = np.zeros(len(group_ids), dtype=int)
+    if isinstance(groups, Solution):
+        ids = groups.group_ids.tolist()
+    else:
+        ids = [GROUP_IDX.get(Cards(group)) for group in groups]
+    for group in ids:
+        i = pos.get(group)
+        if i is None:
+            return None
+        x[i] += 1
+    used = card_mat.T.dot(x)
+    if (np.any(used < card_min) or np.any(used > card_max)
+            or np.any(x > group_max)):
+        return None
+    return x
 
+def program_valid(card_mat, card_min, card_max, group_max, x):
+    '''Returns if x is a valid solution of the program.'''
+    used = card_mat.T.dot(x)
+    return not (np.any(used < card_min) or np.any(used > card_max)
+                or np.any(x > group_max) or np.any(x < 0))
 
-class ParseError(RuntimeError): pass
+def problem_best(card_mat, card_min, card_max, group_max, x_value, x_start):
+    '''Returns the better of a solver's solution (which may be None, not
+    optimal or even invalid if it stopped early) and the valid starting
+    solution (which may be None if there is none).'''
+    if x_value is None:
+        return x_start
+    x_val = np.round(x_value).astype(int)
+    if not program_valid(card_mat, card_min, card_max, group_max, x_val):
+        return x_start
+    if x_start is None:
+        return x_val
+    def score(x):
+        cards, groups = program_score(card_mat, x)
+        return cards * 1024 - groups
+    if score(x_val) > score(x_start):
+        return x_val
+    return x_start
 
-def parse_cards(cards_str):
-    '''Parse a comma-separated list of cards.
+def greedy_grouping(cards, optional_cards=(), start=None, deadline=None):
+    '''Quickly finds a valid (but usually not the best) grouping of cards
+    that uses every card not in optional_cards or returns None.
 
-    Converts common variants of card names such as 10s->ts, ah->1h, 0d->td
-    K♥️ ->kh.
-    '''
-    # Normalize
-    cards_nrm = cards_str.lower()
-    cards_nrm = cards_nrm.replace('10', 't').replace('a', '1').replace('0', 't')
-    cards_nrm = cards_nrm.replace('♠️', 's').replace('♣️', 'c')
-    cards_nrm = cards_nrm.replace('♦️', 'd').replace('♥️', 'h')
-    # Parse
-    cards = [s.strip() for s in cards_nrm.split(',')]
-    # Verify no invalid cards
-    for i, card in enumerate(cards):
-        if card and card not in CARDS:
-            raise ParseError(f'''Invalid card "{cards_str.split(',')[i]}"''')
-    cards = [card for card in cards if card]
-    return cards
-
-def input_cards(input_msg, shortcuts=None):
-    '''Prompts for input of a list of cards and returns the parsed list.
-
-    If the input is invalid, prints an error and prompts again.
-    If 'x' is entered, raises a KeyboardInterrupt.
-    If a shortcuts dictionary is given and `user_input in shortcuts`
-    shortcuts[user_input] will be parsed instead (ensuring user_input is
-    lowercase).
-    '''
+    Starts from the groups in `start` if they are a valid grouping of some of
+    the cards or else from the rounded LP relaxation, covering the required
+    cards it leaves out with `cover_cards`.  Then extends groups with unused
+    cards and adds new groups made from the unused cards.'''
+    cards = Cards(cards)
+    required = cards - Cards(optional_cards)
+    groups = None
+    if start is not None:
+        groups = [Cards(group) for group in start]
+        used = sum(groups, Cards())
+        if not (used <= cards and required <= used
+                and all(group in GROUP_IDX for group in groups)):
+            groups = None
+    if groups is None:
+        group_ids = relaxed_cover(cards.counts, required.counts, deadline)
+        if group_ids is None:
+            return None
+        groups = [GROUP_CARDS[i] for i in group_ids]
+    remaining = cards - sum(groups, Cards())
+
+    # Add unused cards to the ends of sequences or to sets of three
+    extended = True
+    while extended and remaining:
+        extended = False
+        for i, group in enumerate(groups):
+            for card in set(remaining):
+                bigger = group + Cards([card])
+                if bigger in GROUP_IDX:
+                    groups[i] = group = bigger
+                    remaining -= Cards([card])
+                    extended = True
+    # Make new groups from unused cards
+    for i in np.argsort(-GROUP_SIZES, kind='stable'):
+        while GROUP_CARDS[i] <= remaining:
+            groups.append(GROUP_CARDS[i])
+            remaining -= GROUP_CARDS[i]
+    return groups
+
+def relaxed_cover(count_vec, need_vec, deadline=None):
+    '''Returns the indices in `GROUPS` of groups that use every card counted
+    in need_vec and no more cards than count_vec, or None if none were found
+    before the deadline.
+
+    The LP relaxation of the grouping program is solved and rounded down,
+    which is usually already a cover (the relaxation is usually integral).
+    If the LP is infeasible, there is no cover.
+    `cover_cards` covers the needed cards left over, or all of them if that
+    fails.'''
+    from scipy.optimize import Bounds, LinearConstraint, milp
+    count_vec = np.asarray(count_vec, dtype=int)
+    need_vec = np.asarray(need_vec, dtype=int)
+    group_max = groups_available(count_vec)
+    group_ids = np.flatnonzero(group_max)
+    if not len(group_ids):
+        return None if need_vec.any() else []
+    card_mat = GROUP_MAT[group_ids]
+    # The relaxation takes milliseconds so it isn't given the deadline
+    result = milp(-np.diff(card_mat.indptr) + 1/1024,
+                  bounds=Bounds(0, group_max[group_ids]),
+                  constraints=LinearConstraint(card_mat.T, need_vec,
+                                               count_vec))
+    if result.status == 2:
+        return None  # Infeasible
+    if result.x is not None:
+        x_val = np.floor(result.x + 1e-6).astype(int)
+        used = card_mat.T.dot(x_val)
+        rest = cover_cards(count_vec - used, np.maximum(need_vec - used, 0),
+                           deadline)
+        if rest is not None:
+            return np.repeat(group_ids, x_val).tolist() + rest
+    return cover_cards(count_vec, need_vec, deadline)
+
+def cover_cards(count_vec, need_vec, deadline=None,
+                max_nodes=COVER_MAX_NODES):
+    '''Returns the indices in `GROUPS` of groups that use every card counted
+    in need_vec and no more cards than count_vec, or None if none were found
+    in max_nodes steps or before the deadline (after `COVER_MIN_NODES`).
+
+    Each set of cards that share no possible group is covered separately by
+    a depth-first search.  It branches on the needed card with the fewest
+    groups left and tries groups with the most needed cards first, so
+    validly grouped tables are usually covered without backtracking.'''
+    possible = np.flatnonzero(groups_available(count_vec))
+    need = [int(n) for n in need_vec]
+    if not len(possible):
+        return None if any(need) else []
+    group_parts, card_parts = group_components(GROUP_MAT[possible])
+    if any(n and card_parts[c] < 0 for c, n in enumerate(need)):
+        return None  # A needed card is in no possible group
+    available = [int(n) for n in count_vec]
+    members = [GROUP_MEMBERS[g].tolist() for g in possible]
+    card_groups = [[] for _ in need]
+    for g, cards in enumerate(members):
+        for c in cards:
+            card_groups[c].append(g)
+    chosen = []
+    nodes = 0
+
+    def search(part_cards):
+        nonlocal nodes
+        nodes += 1
+        if nodes > max_nodes or (deadline is not None
+                                 and nodes > COVER_MIN_NODES
+                                 and time.perf_counter() > deadline):
+            raise TimeoutError
+        options = None
+        for c in part_cards:
+            if not need[c]:
+                continue
+            fits = [g for g in card_groups[c]
+                    if all(available[m] for m in members[g])]
+            if options is None or len(fits) < len(options):
+                options = fits
+                if len(fits) <= 1:
+                    break
+        if options is None:
+            return True  # Every needed card is used
+        options.sort(key=lambda g: -sum(need[m] > 0 for m in members[g]))
+        for g in options:
+            needed = [m for m in members[g] if need[m]]
+            for m in members[g]:
+                available[m] -= 1
+            for m in needed:
+                need[m] -= 1
+            chosen.append(g)
+            if search(part_cards):
+                return True
+            chosen.pop()
+            for m in members[g]:
+                available[m] += 1
+            for m in needed:
+                need[m] += 1
+        return False
+
+    try:
+        for part in range(group_parts.max()+1):
+            if not search(np.flatnonzero(card_parts == part).tolist()):
+                return None
+    except TimeoutError:
+        return None
+    return possible[chosen].tolist()
+
+def draw_multisets(cards, n):
+    '''Yields (draw, ways) for every multiset of n cards (as Cards) that can
+    be drawn from the given cards, where ways is the number of ways to draw
+    it.'''
+    counts = [(card, cards[card]) for card in set(cards)]
+    def draws_from(i, n):
+        if n == 0:
+            yield {}, 1
+            return
+        if i == len(counts):
+            return
+        card, have = counts[i]
+        for k in range(min(n, have), -1, -1):
+            for rest, ways in draws_from(i+1, n-k):
+                if k:
+                    rest = dict(rest, **{card: k})
+                yield rest, ways * math.comb(have, k)
+    for draw, ways in draws_from(0, n):
+        yield Cards(draw), ways
+
+def forced_groups(card_min, optional_vec, group_max=None):
+    '''Proves that none of the optional cards can be used in any grouping
+    of the cards that uses every required card (card_min).
+
+    A group that is the only one that can be made with a required card must
+    be used, so it is taken out and the remaining cards are checked again
+    until no such group is left.  It is proven if no optional card is then
+    in a group that can be made.  Returns None if not proven, otherwise
+    (group_ids, complete) where group_ids are the groups taken out (sorted)
+    and complete tells if they group every required card.'''
+    card_max = card_min + optional_vec
+    taken = np.zeros(len(GROUPS), dtype=int)
     while True:
-        try:
-            cards_str = input(input_msg)
-            cards_str = cards_str.strip().lower()
-            if cards_str == 'x':
-                raise KeyboardInterrupt()
-            if shortcuts and cards_str in shortcuts:
-                cards_str = shortcuts[cards_str]
-            return parse_cards(cards_str)
-        except ParseError as e:
-            print(str(e), file=sys.stderr)
+        if group_max is None:
+            group_max = groups_available(card_max)
+        possible = group_max > 0
+        # Required cards with only one possible group
+        n_groups = GROUP_MAT.T.dot(possible.astype(np.int8))
+        forced_cards = np.flatnonzero((card_min > 0) & (n_groups == 1))
+        if len(forced_cards) == 0:
+            if GROUP_MAT.dot(card_max - card_min)[possible].any():
+                return None  # An optional card may be used
+            if (n_groups[card_min > 0] == 0).any():
+                return None  # Infeasible so let the solver report it
+            return (np.repeat(np.arange(len(GROUPS)), taken),
+                    not card_min.any())
+        copies = np.zeros(len(GROUPS), dtype=int)
+        for c in forced_cards:
+            groups = CARD_GROUPS[c]
+            g = groups[possible[groups]][0]
+            copies[g] = max(copies[g], card_min[c])
+        used = GROUP_MAT.T.dot(copies)
+        if np.any(used > card_min) or np.any(copies > group_max):
+            return None  # Uses optional cards (or can't be made)
+        taken += copies
+        card_min = card_min - used
+        card_max = card_max - used
+        group_max = None
+
+def groups_available(counts, jokers=0):
+    '''Returns the number of copies of each group in `GROUPS` that can be made
+    from the given counts of each card and number of jokers.
+
+    Each copy of a group may use any of the jokers in place of its missing
+    cards, so a copy can be made if it is missing no more cards than there
+    are jokers.'''
+    counts = np.asarray(counts, dtype=int)
+    if not jokers:
+        def all_cards(has_card):
+            return GROUP_MAT.dot(has_card.astype(np.int8)) == GROUP_SIZES
+        available = np.zeros(len(GROUPS), dtype=int)
+        for n in range(1, counts.max(initial=0)+1):
+            available += all_cards(counts >= n)
+        return available
+    available = np.zeros(len(GROUPS), dtype=int)
+    for n in itertools.count(1):
+        possible = GROUP_MAT.dot(np.maximum(n - counts, 0)) <= jokers
+        if not possible.any():
+            return available
+        available += possible
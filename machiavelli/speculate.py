@@ -0,0 +1,138 @@
+'''Solves the likely next positions of an interactive game in the background
+while the player types, so the next solve is usually answered from the
+cache.
+
+After each solve, the likely next positions are the table after playing the
+suggested cards and the table and hand after drawing each unseen card
+(with no plays by the other players).  They are solved in a thread by a
+second solver that shares the first solver's `SolutionCache`.  Solving
+stops when the real next position is known (see `Speculator.stop`).  Each
+position gets a short time limit so stopping never waits long, and only
+groupings proven to be the best are cached.
+
+The thread never uses the CVXPY backends: they point fd 1 at /dev/null
+while solving (see `solver.problem_solve_suppress_stdout`), which would
+hide the interactive thread's output.
+'''
+
+import threading
+
+from .cards import CARDS, Cards
+
+
+MAX_POSITIONS = 64  # Positions solved ahead after each solve
+SOLVE_SECONDS = 0.25  # Time limit of each position solved ahead
+# Backends that solve in this process without redirecting stdout
+QUIET_BACKENDS = ('milp', 'native')
+
+
+class Speculator:
+    '''Solves candidate next positions for `solver` in a background thread.
+
+    The solutions go in `solver.cache` (which is bounded), so `solver.solve`
+    finds them.  They are solved with `solver`'s backend if it is in
+    `QUIET_BACKENDS` and with milp otherwise.  `checked` and `hits` count the
+    real positions checked with `check` and how many of them were solved
+    ahead.'''
+    def __init__(self, solver, max_positions=MAX_POSITIONS):
+        from .solver import Solver
+        if solver.cache is None:
+            raise ValueError('speculation needs a solver with a cache')
+        self.cache = solver.cache
+        backend = solver.backend
+        if backend not in QUIET_BACKENDS:
+            backend = 'milp'
+        self.solver = Solver(quiet=True, backend=backend,
+                             lp_first=solver.lp_first, cache=solver.cache,
+                             deck=solver.deck)
+        self.max_positions = max_positions
+        self.checked = 0
+        self.hits = 0
+        self.solved = 0
+        self._ready = set()
+        self._cancel = threading.Event()
+        self._thread = None
+
+    def start(self, position, sol, optimal=True):
+        '''Starts solving the likely positions after `position`, whose best
+        grouping is `sol`.  If `sol` isn't known to be `optimal` (it was
+        found in a time limit), no positions are derived from it.'''
+        self.stop()
+        self._cancel = threading.Event()
+        self._ready = set()
+        todo = []
+        if position.jokers:
+            return  # Positions with jokers aren't cached
+        for cards, hand, next_sol in candidates(position, sol,
+                                                self.solver.deck.copies,
+                                                optimal):
+            if len(todo) >= self.max_positions:
+                break
+            if next_sol is not None:
+                # Known without solving
+                self.cache.put(cards, hand, next_sol)
+                self._ready.add((bytes(cards), bytes(hand)))
+            else:
+                todo.append((cards, hand))
+        self._thread = threading.Thread(target=self._run,
+                                        args=(todo, self._cancel),
+                                        daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        '''Stops solving after the current position.'''
+        self._cancel.set()
+
+    def stop(self):
+        '''Stops solving and waits for the current position to finish (at
+        most about `SOLVE_SECONDS`).'''
+        self.cancel()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def check(self, position):
+        '''Counts whether the position was solved ahead and returns it.'''
+        hit = (bytes(position.cards), bytes(position.hand)) in self._ready
+        self.checked += 1
+        self.hits += hit
+        return hit
+
+    def _run(self, todo, cancel):
+        for cards, hand in todo:
+            if cancel.is_set():
+                return
+            try:
+                self.solver.solve(cards, hand, time_limit=SOLVE_SECONDS)
+            except (RuntimeError, ValueError):
+                continue
+            if not self.solver.stats.get('optimal'):
+                continue  # Timed out so not cached
+            self._ready.add((bytes(cards), bytes(hand)))
+            self.solved += 1
+
+def candidates(position, sol, copies=2, optimal=True):
+    '''Yields (cards, hand, sol) for the likely next positions, most likely
+    first, where sol is the solution if it is already known (or None).
+
+    These are the position after playing the cards used by `sol` and the
+    position after drawing each card with fewer than `copies` out.  A
+    drawn card that can't be in any group doesn't change the grouping, so
+    its solution is known if `sol` is `optimal`.'''
+    from .solver import Solution
+    cards, hand = position.cards, position.hand
+    if sol and sol.played:
+        yield cards, hand - sol.played, None
+    position = position.copy()
+    for card in CARDS:
+        if cards[card] >= copies:
+            continue
+        draw = Cards([card])
+        position.add(hand=draw)
+        if (sol is not None and optimal
+                and not len(position.groups_with(card))):
+            yield (cards + draw, hand + draw,
+                   Solution(sol.group_ids, cards + draw, hand + draw))
+        else:
+            yield cards + draw, hand + draw, None
+        position.remove(hand=draw)
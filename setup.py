@@ -34,16 +34,24 @@ setup(
         'License :: OSI Approved :: MIT License',
         'Development Status :: 3 - Alpha',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.7',
-        'Programming Language :: Python :: 3.8',
         'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
     ],
+    python_requires = '>=3.9',
     install_requires = [
         'numpy~=1.11',
-        'cvxpy~=1.1',
-        'cvxopt~=1.2',
+        'scipy~=1.9',
         'termcolor~=1.1',
         'colorama~=0.3',
     ],
+    extras_require = {
+        # For --backend cvxpy and more solvers in --backend portfolio
+        'cvxpy': [
+            'cvxpy~=1.1',
+            'cvxopt~=1.2',
+        ],
+    },
 )
 
@@ -0,0 +1,49 @@
+'''Checks `machiavelli batch` (see `command.solve_batch`).'''
+
+import io
+import json
+
+import pytest
+
+from machiavelli.command import solve_batch
+
+
+LINES = [
+    '{"id": 1, "table": "7c,8c,9c", "hand": "1c,2c,3c,kh"}',
+    '{"table": 5}',
+    '[1]',
+    'not json',
+    '',
+    '{"id": 2, "table": "1c,2c,3c", "hand": "1c,1c"}',
+    '{"id": 3, "table": "7c,8c,9c", "hand": "kh"}',
+    '{"id": 4, "table": "7c,8c", "hand": "kh"}',
+]
+
+def run_batch(lines, workers):
+    out = io.StringIO()
+    solve_batch(lines, out, workers=workers)
+    return [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_batch(workers):
+    records = run_batch(LINES, workers)
+    assert len(records) == 7  # The blank line is skipped
+    assert records[0] == {'id': 1, 'groups': ['1c,2c,3c', '7c,8c,9c'],
+                          'play': '1c,2c,3c', 'hand': 'kh'}
+    assert "'int' object is not iterable" in records[1]['error']
+    assert records[2] == {'error': 'position must be a JSON object'}
+    assert 'error' in records[3]
+    assert records[4] == {'id': 2, 'error': 'more than 2 of card: 1c (x3)'}
+    assert records[5] == {'id': 3, 'groups': ['7c,8c,9c'], 'play': '',
+                          'hand': 'kh'}
+    assert records[6]['id'] == 4
+    assert records[6]['groups'] is None
+
+def test_batch_order():
+    lines = [json.dumps({'id': i, 'table': '7c,8c,9c', 'hand': hand})
+             for i, hand in enumerate(['1c,2c,3c', 'kh', 'tc,jc', '6c'] * 5)]
+    records = run_batch(lines, workers=2)
+    assert [record['id'] for record in records] == list(range(20))
+    assert [record['play'] for record in records[:4]] == [
+        '1c,2c,3c', '', 'tc,jc', '6c']
@@ -0,0 +1,76 @@
+'''Checks that `SolutionCache` serves suit-permuted positions and keeps
+solutions in its sqlite database.'''
+
+import itertools
+import random
+
+import pytest
+
+from machiavelli.cache import SolutionCache
+from machiavelli.cards import CARDS, SUITS, Cards
+from machiavelli.solver import Solution, Solver
+
+
+TABLE = '1s,2s,3s,7c,7d,7h,9d,td,jd'
+HAND = '4s,kh,qd'
+
+def permute_suits(cards, perm):
+    '''Returns the cards with suit SUITS[i] replaced by SUITS[perm[i]].'''
+    mapping = dict(zip(SUITS, (SUITS[i] for i in perm)))
+    return Cards([card[0] + mapping[card[1]] for card in cards])
+
+def assert_valid(groups, cards, optional_cards):
+    '''Checks that the groups are a grouping of the cards that uses every
+    card not in optional_cards.'''
+    sol = Solution.from_groups(groups, cards, optional_cards)
+    assert sol.used <= cards
+    assert cards - optional_cards <= sol.used
+
+
+@pytest.mark.parametrize('perm', list(itertools.permutations(range(4))))
+def test_suit_permuted_hit(perm):
+    cache = SolutionCache()
+    solver = Solver(quiet=True, cache=cache)
+    cards, hand = Cards(TABLE) + Cards(HAND), Cards(HAND)
+    sol = solver.solve(cards, hand)
+    cards2, hand2 = permute_suits(cards, perm), permute_suits(hand, perm)
+    sol2 = solver.solve(cards2, hand2)
+    assert solver.stats['status'] == 'cached'
+    assert cache.hits == 1
+    assert (sol2.n_used, len(sol2)) == (sol.n_used, len(sol))
+    assert_valid(list(sol2), cards2, hand2)
+
+def test_random_permuted_positions():
+    rng = random.Random(0)
+    cache = SolutionCache()
+    for _ in range(50):
+        cards = Cards(rng.sample(CARDS * 2, rng.randint(3, 30)))
+        hand = Cards(rng.sample(list(cards), rng.randint(0, len(cards))))
+        try:
+            sol = Solver(quiet=True).solve(cards, hand)
+        except RuntimeError:
+            sol = None  # Infeasible
+        cache.put(cards, hand, sol)
+        perm = rng.sample(range(4), 4)
+        cards2, hand2 = permute_suits(cards, perm), permute_suits(hand, perm)
+        groups = cache.get(cards2, hand2)
+        if sol is None:
+            assert groups is None
+        else:
+            assert_valid(groups, cards2, hand2)
+            assert sum(len(group) for group in groups) == sol.n_used
+
+def test_sqlite_round_trip(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cards, hand = Cards(TABLE) + Cards(HAND), Cards(HAND)
+    cache = SolutionCache(path=path)
+    sol = Solver(quiet=True, cache=cache).solve(cards, hand)
+    cache.close()
+
+    cache = SolutionCache(path=path)
+    assert len(cache) == 0  # Not in memory yet
+    groups = cache.get(permute_suits(cards, (1, 2, 3, 0)),
+                       permute_suits(hand, (1, 2, 3, 0)))
+    assert [permute_suits(group, (3, 0, 1, 2)) for group in groups] == (
+        list(sol))
+    cache.close()
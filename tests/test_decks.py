@@ -0,0 +1,118 @@
+'''Checks solves with jokers against brute force and with three or four
+decks.'''
+
+import itertools
+import random
+
+import pytest
+
+from machiavelli.cards import CARDS, JOKER, Cards, Deck
+from machiavelli.solver import (CARD_GROUPS, CARD_IDX, GROUP_CARDS, GROUPS,
+                                Solver, groups_available)
+
+
+def score(sol):
+    return None if sol is None else (sol.n_used, len(sol))
+
+def solve(cards, optional_cards, deck, backend='milp'):
+    try:
+        return Solver(quiet=True, backend=backend, deck=deck).solve(
+            cards, optional_cards)
+    except RuntimeError:
+        return None  # Infeasible
+
+def brute_force(cards, optional_cards):
+    '''Returns the best score of the position over every card each joker can
+    stand in for (or leaving out hand jokers), solved without jokers.'''
+    real = Cards(card for card in cards if card != JOKER)
+    # Only cards in a group with one of the real cards can help
+    near = sorted({str(card) for c in set(real)
+                   for group in CARD_GROUPS[CARD_IDX[c]]
+                   for card in GROUP_CARDS[group]})
+    table_jokers = cards.jokers - optional_cards.jokers
+    choices = ([near] * table_jokers
+               + [near + [None]] * optional_cards.jokers)
+    best = None
+    for stand_ins in itertools.product(*choices):
+        table_cards = Cards(stand_ins[:table_jokers])
+        hand_cards = Cards(c for c in stand_ins[table_jokers:] if c)
+        sol = solve(real + table_cards + hand_cards,
+                    Cards(c for c in optional_cards if c != JOKER)
+                    + hand_cards, Deck(4))
+        if sol is not None:
+            best = max(best or (0, -len(GROUPS)), (sol.n_used, -len(sol)))
+    return None if best is None else (best[0], -best[1])
+
+JOKER_POSITIONS = [
+    (Cards('7c,8c,jk'), Cards()),
+    (Cards('7c,8c,jk,1s,1d'), Cards('1s,1d,jk')),
+    (Cards('7c,8c,9c,jk,kh'), Cards('jk,kh')),
+    (Cards('4h,6h,jk,qs,qd,jk'), Cards('qs,qd,jk')),
+    (Cards('2s,3s,4s,5s,jk,2d,jk'), Cards('2d,jk')),
+    (Cards('1h,jk,kh,qh,9c,tc'), Cards('9c,tc')),
+]
+
+
+def random_joker_positions(seed, n=6):
+    '''Returns `n` seeded small positions with one joker standing in for a
+    card of a validly grouped table or in the hand.'''
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(n):
+        table = Cards()
+        for group in rng.sample(GROUPS, 2):
+            table += Cards(group)
+        hand = Cards(rng.sample(CARDS, 3))
+        if rng.random() < 0.5:
+            table = table - Cards([rng.choice(list(table))]) + Cards([JOKER])
+        else:
+            hand += Cards([JOKER])
+        positions.append((table + hand, hand))
+    return positions
+
+
+@pytest.mark.parametrize('cards,optional_cards',
+                         JOKER_POSITIONS + random_joker_positions(0))
+def test_jokers_match_brute_force(cards, optional_cards):
+    sol = solve(cards, optional_cards, Deck(2, cards.jokers))
+    assert score(sol) == brute_force(cards, optional_cards)
+    if sol is not None:
+        assert cards - optional_cards <= sol.used <= cards
+
+def test_too_many_jokers():
+    with pytest.raises(ValueError):
+        Solver(quiet=True, deck=Deck(2, 1)).play_hand('7c,8c,jk', 'jk')
+
+@pytest.mark.parametrize('copies', [3, 4])
+def test_groups_available(copies):
+    counts = Cards(CARDS * copies).counts
+    available = groups_available(counts)
+    assert available.min() == available.max() == copies
+    assert len(available) == len(GROUPS)
+
+@pytest.mark.parametrize('copies', [3, 4])
+def test_decks_native_matches_milp(copies):
+    rng = random.Random(copies)
+    deck = Deck(copies)
+    for _ in range(10):
+        table = Cards()
+        pool = Cards(CARDS * copies)
+        for group in rng.sample(GROUPS, 12):
+            for _ in range(rng.randint(1, copies)):
+                if Cards(group) <= pool:
+                    pool -= Cards(group)
+                    table += Cards(group)
+        hand = Cards(rng.sample(list(pool), 10))
+        milp = Solver(quiet=True, deck=deck).play_hand(table, hand)
+        native = Solver(quiet=True, deck=deck, backend='native',
+                        lp_first=True).play_hand(table, hand)
+        assert score(native) == score(milp)
+        assert table <= milp.used
+        assert table.max_count() <= copies
+
+def test_deck_copies_enforced():
+    position = ('7c,7c,7c,8c,8c,8c,9c,9c,9c', '7d,7d,7h,7h')
+    with pytest.raises(ValueError):
+        Solver(quiet=True).play_hand(*position)
+    sol = Solver(quiet=True, deck=Deck(4)).play_hand(*position)
+    assert score(sol) == (9, 3)
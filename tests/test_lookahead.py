@@ -0,0 +1,47 @@
+'''Checks `Solver.lookahead`, which evaluates every possible draw.'''
+
+import math
+
+import pytest
+
+from machiavelli.cards import CARDS, Cards
+from machiavelli.solver import Solver
+
+
+TABLE = Cards('7c,8c,9c,1s,1d,1h,4h,5h,6h')
+HAND = Cards('tc,2s,ks,qd,5d')
+
+
+@pytest.mark.parametrize('draws', [1, 2])
+def test_probabilities_sum_to_one(draws):
+    solver = Solver(quiet=True)
+    outcomes = solver.lookahead(TABLE, HAND, draws=draws)
+    assert math.isclose(sum(o.probability for o in outcomes), 1)
+    assert len({o.draw for o in outcomes}) == len(outcomes)
+    assert all(len(o.draw) == draws for o in outcomes)
+    playable = [o.playable for o in outcomes]
+    assert playable == sorted(playable, reverse=True)
+
+def test_unseen_probabilities():
+    unseen = Cards('jc,jc,2d')
+    outcomes = Solver(quiet=True).lookahead(TABLE, HAND, unseen=unseen)
+    probabilities = {str(o.draw): o.probability for o in outcomes}
+    assert probabilities == pytest.approx({'jc': 2/3, '2d': 1/3})
+
+def test_playable_matches_solve():
+    solver = Solver(quiet=True)
+    outcomes = solver.lookahead(TABLE, HAND)
+    assert len(outcomes) == len(set(Cards(CARDS * 2) - TABLE - HAND))
+    for o in outcomes[:10] + outcomes[-5:]:
+        hand = HAND + o.draw
+        sol = Solver(quiet=True).solve(TABLE + hand, hand)
+        assert o.playable == len(sol.played), str(o.draw)
+
+def test_time_limit():
+    solver = Solver(quiet=True)
+    outcomes = solver.lookahead(TABLE, HAND, time_limit=0)
+    assert math.isclose(sum(o.probability for o in outcomes), 1)
+    unsolved = [o for o in outcomes if o.playable is None]
+    assert unsolved
+    assert len(unsolved) == solver.stats['hypotheses_unsolved']
+    assert outcomes[len(outcomes) - len(unsolved):] == unsolved
@@ -0,0 +1,47 @@
+'''Checks that solving the LP relaxation first (`Solver(lp_first=True)`)
+gives the same scores as a plain solve.'''
+
+import random
+
+import pytest
+
+from machiavelli.cards import CARDS, Cards, backend_error
+from machiavelli.solver import GROUPS, Solver
+
+
+def random_positions(seed, n=30):
+    '''Returns `n` seeded (table, hand) positions with validly grouped
+    tables of up to about 80 cards.'''
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(n):
+        deck = Cards(CARDS * 2)
+        table = Cards()
+        table_size = rng.randint(0, 80)
+        while len(table) < table_size:
+            group = Cards(rng.choice(GROUPS))
+            if group <= deck:
+                deck -= group
+                table += group
+        positions.append((table, Cards(rng.sample(list(deck),
+                                                  rng.randint(1, 12)))))
+    return positions
+
+def score(sol):
+    return None if sol is None else (sol.n_used, len(sol))
+
+BACKENDS = ['milp', 'native',
+            pytest.param('cvxpy', marks=pytest.mark.skipif(
+                backend_error('cvxpy') is not None,
+                reason='CVXPY is not installed'))]
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_same_scores(backend):
+    plain = Solver(quiet=True, backend=backend)
+    relaxed = Solver(quiet=True, backend=backend, lp_first=True)
+    for table, hand in random_positions(0):
+        assert score(relaxed.play_hand(table, hand)) == score(
+            plain.play_hand(table, hand)), (str(table), str(hand))
+    assert relaxed.relaxations['solved']
+    assert relaxed.relaxations['integral']
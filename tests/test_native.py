@@ -0,0 +1,88 @@
+'''Checks that the native branch-and-bound search finds solutions as good as
+SciPy's MILP solver.'''
+
+import random
+
+import pytest
+
+from machiavelli.cards import CARDS, Cards
+from machiavelli.native import branch_and_bound, program_score
+from machiavelli.solver import (GROUPS, Solver, encode_program,
+                                groups_available, program_valid)
+
+
+def random_positions(seed, n=30):
+    '''Returns `n` seeded (cards, optional_cards) positions from two decks,
+    each with a validly grouped table.'''
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(n):
+        deck = Cards(CARDS * 2)
+        table = Cards()
+        for group in rng.sample(GROUPS, rng.randint(0, 12)):
+            if Cards(group) <= deck:
+                deck -= Cards(group)
+                table += Cards(group)
+        hand = Cards(rng.sample(list(deck), rng.randint(1, 12)))
+        positions.append((table + hand, hand))
+    return positions
+
+def full_deck_positions(seed, n=3):
+    '''Returns `n` positions with every card of both decks out.'''
+    rng = random.Random(seed)
+    return [(Cards(CARDS * 2), Cards(rng.sample(CARDS * 2, 12)))
+            for _ in range(n)]
+
+ACE_HIGH_POSITIONS = [
+    # Ace-high sequences only
+    (Cards('qh,kh,1h'), Cards('1h')),
+    (Cards('js,qs,ks,1s,tc,jc,qc,kc,1c'), Cards('1s,1c')),
+    # An ace that can go low or high
+    (Cards('1d,2d,3d,qd,kd,1d'), Cards('1d')),
+    (Cards('1h,2h,3h,4h,jh,qh,kh,1h,1s,1c'), Cards('1h,1s,1c')),
+    # A sequence of every rank with another ace to play on either end
+    (Cards('1s,2s,3s,4s,5s,6s,7s,8s,9s,ts,js,qs,ks,1s'), Cards('1s')),
+]
+
+def score_programs(cards, optional_cards):
+    '''Returns the (cards used, groups used) of the native and MILP solutions
+    of the position's program.'''
+    _, card_mat, card_min, card_max, group_max, dead = encode_program(
+        cards.counts, optional_cards.counts, groups_available(cards.counts))
+    if dead.any() or not len(group_max):
+        return None, None  # Nothing to solve
+    x_native = branch_and_bound(card_mat, card_min, card_max, group_max)
+    x_milp = Solver(quiet=True).solve_program_milp(
+        card_mat, card_min, card_max, group_max)
+    if x_native is not None:
+        assert program_valid(card_mat, card_min, card_max, group_max,
+                             x_native)
+    return program_score(card_mat, x_native), program_score(card_mat, x_milp)
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_random_positions(seed):
+    for cards, optional_cards in random_positions(seed):
+        native, milp = score_programs(cards, optional_cards)
+        assert native == milp, (str(cards), str(optional_cards))
+
+def test_full_deck():
+    for cards, optional_cards in full_deck_positions(0):
+        native, milp = score_programs(cards, optional_cards)
+        assert native is not None
+        assert native == milp, str(optional_cards)
+
+@pytest.mark.parametrize('cards,optional_cards', ACE_HIGH_POSITIONS)
+def test_ace_high(cards, optional_cards):
+    native, milp = score_programs(cards, optional_cards)
+    assert native is not None
+    assert native == milp
+
+@pytest.mark.parametrize('cards,optional_cards',
+                         full_deck_positions(1, n=1) + ACE_HIGH_POSITIONS)
+def test_backends_agree(cards, optional_cards):
+    scores = []
+    for backend in ('native', 'milp'):
+        sol = Solver(quiet=True, backend=backend).solve(cards, optional_cards)
+        scores.append((sol.n_used, len(sol)))
+    assert scores[0] == scores[1]
@@ -0,0 +1,63 @@
+'''Checks that `Position` keeps its groups in step with `groups_available`
+as cards are added, removed and played.'''
+
+import random
+
+import numpy as np
+import pytest
+
+from machiavelli.cards import CARD_IDX, CARDS, JOKER, Cards
+from machiavelli.solver import CARD_GROUPS, Position, groups_available
+
+
+def assert_matches(position):
+    counts = position.cards.counts
+    expected = groups_available(counts, position.jokers)
+    assert np.array_equal(position.group_max, expected)
+    for card in set(position.cards) - {JOKER}:
+        groups = CARD_GROUPS[CARD_IDX[card]]
+        assert np.array_equal(position.groups_with(card),
+                              groups[expected[groups] > 0])
+
+
+@pytest.mark.parametrize('copies', [2, 4])
+def test_random_moves(copies):
+    rng = random.Random(copies)
+    deck = CARDS * copies
+    cards = rng.sample(deck, 35)
+    position = Position(cards[:30], cards[30:])
+    assert_matches(position)
+    for _ in range(200):
+        move = rng.choice(('add', 'remove', 'play'))
+        table, hand = list(position.table), list(position.hand)
+        if move == 'add':
+            left = list(Cards(deck) - position.cards)
+            cards = Cards(rng.sample(left, min(rng.randint(1, 4), len(left))))
+            if rng.random() < 0.5:
+                position.add(table=cards)
+            else:
+                position.add(hand=cards)
+        elif move == 'remove':
+            position.remove(table=rng.sample(table, min(3, len(table))),
+                            hand=rng.sample(hand, min(1, len(hand))))
+        else:
+            position.play(rng.sample(hand, min(2, len(hand))))
+        assert_matches(position)
+
+def test_copy_is_independent():
+    position = Position('7c,8c,9c', 'tc')
+    other = position.copy()
+    other.add(hand='jc,qc')
+    other.play('tc')
+    assert_matches(position)
+    assert_matches(other)
+    assert str(position.hand) == 'tc'
+    assert str(other.table) == '7c,8c,9c,tc'
+
+def test_jokers():
+    position = Position('7c,8c,jk', '9d')
+    assert_matches(position)
+    position.add(hand='jk')
+    assert_matches(position)
+    position.remove(table='jk')
+    assert_matches(position)
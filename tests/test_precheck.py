@@ -0,0 +1,50 @@
+'''Checks that the no-play precheck (see `Solver.no_play_solution`) gives the
+same answers as a full solve.'''
+
+import random
+
+from machiavelli.cards import CARDS, Cards
+from machiavelli.solver import GROUPS, Solver
+
+
+def random_positions(seed, n=100):
+    '''Returns `n` seeded (table, hand) positions from two decks with a
+    validly grouped table and a small hand, so nothing is often playable.'''
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(n):
+        deck = Cards(CARDS * 2)
+        table = Cards()
+        for group in rng.sample(GROUPS, rng.randint(1, 10)):
+            if Cards(group) <= deck:
+                deck -= Cards(group)
+                table += Cards(group)
+        positions.append((table, Cards(rng.sample(list(deck),
+                                                  rng.randint(1, 4)))))
+    return positions
+
+def score(sol):
+    return None if sol is None else (sol.n_used, len(sol))
+
+
+def test_precheck_matches_solve():
+    solver = Solver(quiet=True)
+    hits = 0
+    for table, hand in random_positions(0):
+        sol = solver.solve(table + hand, hand)
+        if solver.stats['status'] == 'no-play':
+            hits += 1
+            assert sol.n_used == len(table)
+        full = Solver(quiet=True).find_solutions(table + hand, hand)
+        assert score(sol) == score(full[0] if full else None), (
+            str(table), str(hand))
+    assert hits  # The precheck was tried
+
+def test_incumbent_with_extra_groups():
+    # The table has a grouping with fewer groups than the incumbent
+    solver = Solver(quiet=True)
+    sol = solver.solve(Cards('1s,2s,3s,4s,5s,6s,kh'), Cards('kh'),
+                       incumbent=[Cards('1s,2s,3s'), Cards('4s,5s,6s')])
+    assert [str(group) for group in sol] == ['1s,2s,3s,4s,5s,6s']
+    assert solver.stats['status'] == 'no-play'
+    assert solver.stats['optimal']
@@ -0,0 +1,45 @@
+'''Checks the requests of `machiavelli serve` (see `serve.Server.handle`).'''
+
+import asyncio
+
+import pytest
+
+from machiavelli.cache import SolutionCache
+from machiavelli.serve import Server
+
+
+@pytest.fixture
+def server():
+    server = Server(workers=1, cache=SolutionCache())
+    server.start()
+    yield server
+    server.close()
+
+def handle(server, **request):
+    return asyncio.run(server.handle(request))
+
+
+def test_session_and_stats(server):
+    response = handle(server, op='solve', table='7c,8c,9c',
+                      hand='1c,2c,3c,kh')
+    assert response == {'groups': ['1c,2c,3c', '7c,8c,9c'],
+                        'play': '1c,2c,3c', 'hand': 'kh'}
+    session = handle(server, op='new', table='7c,8c,9c', hand='tc')['session']
+    handle(server, op='add', session=session, hand='1c,2c,3c')
+    response = handle(server, op='play_hand', session=session)
+    assert response['play'] == '1c,2c,3c,tc'
+    handle(server, op='solve', table='7c,8c,9c', hand='1c,2c,3c,kh')
+    assert handle(server, op='stats') == dict(
+        requests=6, sessions=1, workers=1, cache_hits=1, cache_misses=2,
+        cache_size=2)
+    handle(server, op='close', session=session)
+    assert handle(server, op='stats')['sessions'] == 0
+
+def test_bad_requests(server):
+    with pytest.raises(ValueError):
+        handle(server, op='fly')
+    with pytest.raises(ValueError):
+        handle(server, op='add', session='7')
+    with pytest.raises(ValueError):
+        handle(server, op='solve', hand='1c,1c,1c')
+    assert handle(server, op='stats')['requests'] == 4
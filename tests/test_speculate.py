@@ -0,0 +1,47 @@
+'''Checks that `speculate.Speculator` only caches the best groupings.'''
+
+import time
+
+from machiavelli.cache import SolutionCache
+from machiavelli.cards import CARDS, Cards
+from machiavelli.solver import Position, Solution, Solver
+from machiavelli.speculate import SOLVE_SECONDS, Speculator, candidates
+
+
+TABLE = '1s,2s,3s,4s,5s,6s'
+
+def two_groups(position):
+    '''Returns a valid grouping of TABLE with more groups than needed.'''
+    return Solution.from_groups([Cards('1s,2s,3s'), Cards('4s,5s,6s')],
+                                position.cards, position.hand)
+
+
+def test_candidates_known_only_if_optimal():
+    position = Position(TABLE, 'kh')
+    sol = two_groups(position)
+    known = [next_sol for _, _, next_sol in candidates(position, sol)]
+    assert any(next_sol is not None for next_sol in known)
+    assert all(next_sol is None for _, _, next_sol
+               in candidates(position, sol, optimal=False))
+
+def test_speculator_caches_best_grouping():
+    position = Position(TABLE, 'kh')
+    solver = Solver(quiet=True, cache=SolutionCache())
+    speculator = Speculator(solver)
+    speculator.start(position, two_groups(position), optimal=False)
+    speculator.stop()
+    draw = Cards('td')  # Can't be in any group
+    groups = solver.cache.get(position.cards + draw, position.hand + draw)
+    assert groups is None or [str(group) for group in groups] == [TABLE]
+
+def test_stop_is_prompt():
+    # A table of every card with most draws playable
+    hand = Cards('ks,kc,kd,kh')
+    position = Position(Cards(CARDS) - hand, hand)
+    solver = Solver(quiet=True, backend='native', cache=SolutionCache())
+    sol = solver.play_hand(position)
+    speculator = Speculator(solver)
+    speculator.start(position, sol, solver.stats['optimal'])
+    start = time.perf_counter()
+    speculator.stop()
+    assert time.perf_counter() - start < SOLVE_SECONDS * 4
@@ -0,0 +1,54 @@
+'''Checks time-limited solves (`Solver.solve(..., time_limit=...)`).'''
+
+import random
+
+import pytest
+
+from machiavelli.cache import SolutionCache
+from machiavelli.cards import CARDS, Cards, backend_error
+from machiavelli.solver import GROUPS, Solver
+
+
+def late_positions(seed, n=4, table_size=85):
+    '''Returns `n` seeded (table, hand) positions with a large validly
+    grouped table, which can't be solved in a millisecond.'''
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(n):
+        deck = Cards(CARDS * 2)
+        table = Cards()
+        while len(table) < table_size:
+            group = Cards(rng.choice(GROUPS))
+            if group <= deck:
+                deck -= group
+                table += group
+        positions.append((table, Cards(rng.sample(list(deck), 12))))
+    return positions
+
+BACKENDS = ['milp', 'native',
+            pytest.param('cvxpy', marks=pytest.mark.skipif(
+                backend_error('cvxpy') is not None,
+                reason='CVXPY is not installed'))]
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_best_so_far(backend):
+    for table, hand in late_positions(0):
+        cache = SolutionCache()
+        solver = Solver(quiet=True, backend=backend, cache=cache)
+        sol = solver.solve(table + hand, hand, time_limit=0.001)
+        assert sol is not None
+        assert table <= sol.used <= table + hand
+        assert solver.stats['optimal'] is False
+        assert solver.stats['status'] == 'best-so-far'
+        assert len(cache) == 0
+
+def test_enough_time_is_optimal():
+    for table, hand in late_positions(1, n=2):
+        cache = SolutionCache()
+        solver = Solver(quiet=True, cache=cache)
+        sol = solver.solve(table + hand, hand, time_limit=60)
+        assert solver.stats['optimal'] is True
+        assert len(cache) == 1
+        best = Solver(quiet=True).solve(table + hand, hand)
+        assert (sol.n_used, len(sol)) == (best.n_used, len(best))
@@ -0,0 +1,62 @@
+'''Checks `Solver.solve(..., top_k=k)`, which lists the best distinct plays.'''
+
+import random
+
+import pytest
+
+from machiavelli.cards import CARDS, Cards, backend_error
+from machiavelli.solver import GROUPS, Solver
+
+
+def random_positions(seed, n=15):
+    '''Returns `n` seeded (table, hand) positions with a validly grouped
+    table.'''
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(n):
+        deck = Cards(CARDS * 2)
+        table = Cards()
+        for group in rng.sample(GROUPS, rng.randint(1, 8)):
+            if Cards(group) <= deck:
+                deck -= Cards(group)
+                table += Cards(group)
+        positions.append((table, Cards(rng.sample(list(deck),
+                                                  rng.randint(2, 10)))))
+    return positions
+
+def scores(sols):
+    return [(sol.n_used, len(sol)) for sol in sols]
+
+BACKENDS = ['native',
+            pytest.param('cvxpy', marks=pytest.mark.skipif(
+                backend_error('cvxpy') is not None,
+                reason='CVXPY is not installed'))]
+
+
+def test_distinct_best_first():
+    solver = Solver(quiet=True)
+    for table, hand in random_positions(0):
+        sols = solver.solve(table + hand, hand, top_k=5)
+        assert sols
+        plays = [sol.played for sol in sols]
+        assert len(set(plays)) == len(plays)
+        ranked = [(-n_used, groups) for n_used, groups in scores(sols)]
+        assert ranked == sorted(ranked)
+        for sol in sols:
+            assert table <= sol.used <= table + hand
+        best = solver.solve(table + hand, hand)
+        assert scores(sols[:1]) == scores([best])
+
+def test_example():
+    table, hand = Cards('7c,8c,9c'), Cards('1c,2c,3c,6c,tc,7d,7h')
+    sols = Solver(quiet=True).solve(table + hand, hand, top_k=3)
+    assert [str(sol.played) for sol in sols[:2]] == [
+        '1c,2c,3c,7d,7h,tc', '1c,2c,3c,6c,tc']
+    assert scores(sols[2:]) == [(7, 2)]
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_backends_agree(backend):
+    milp, other = Solver(quiet=True), Solver(quiet=True, backend=backend)
+    for table, hand in random_positions(1):
+        assert scores(other.solve(table + hand, hand, top_k=4)) == scores(
+            milp.solve(table + hand, hand, top_k=4))